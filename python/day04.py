@@ -1,21 +1,12 @@
-from math import inf
-from typing import List
-
 from util import Grid
 
 def part1g(inp: Grid):
-    unblocked = inp.filter(lambda gi: gi.data == "@" and gi.count_neighbors(lambda n: n.data == "@", diagonal = True) < 4)
-    return len(unblocked)
+    rolls = inp.filter_mask("@")
+    counts = inp.neighbor_counts("@", diagonal = True)
+    return sum(1 for roll, count in zip(rolls, counts) if roll and count < 4)
 
 def part2g(inp: Grid):
-    result = 0
-    removed = inf
-    while removed > 0:
-        unblocked = inp.filter(lambda gi: gi.data == "@" and gi.count_neighbors(lambda n: n.data == "@", diagonal = True) < 4)
-        inp = inp.map(lambda gi: "." if gi in unblocked else gi.data)
-        removed = len(unblocked)
-        result += removed
-    return result
+    return inp.erode("@", lambda count: count < 4, ".", diagonal = True)
 
 print("TEST DAY 04:")
 test_inp = Grid.read("res/day04a.txt")
@@ -1,57 +1,48 @@
-from collections import deque
-from functools import lru_cache
-from typing import List
+from typing import Tuple
 
 from util import (
     Grid,
 )
 
 
-def part1g(inp: Grid):
-    result = 0
-    start = inp.filter(lambda gi: gi.data == "S")[0]
-    points: deque[Grid.GridItem[str]] = deque([start])
-    seen = set()
-    splitters = set()
-    while len(points) > 0:
-        point = points.popleft()
-        splitter = point.raycast((0, 1), lambda gi: gi.data == "^")
-        if splitter is not None:
-            if splitter.data == "^":
-                splitters.add(splitter.position())
-                result += 1
-            if splitter.y == inp.size()[1] - 1:
+def propagate(inp: Grid) -> Tuple[int, int]:
+    """
+    Sweeps the beam down one row at a time, tracking how many timelines are
+    in each column. Returns the number of splitters hit and the number of
+    timelines that reach the bottom.
+    """
+    width, height = inp.size()
+    splitters = inp.filter_mask("^")
+    start = inp.find("S")
+    # Timeline counts can outgrow a machine word on deep inputs, so this is a
+    # list of python ints rather than an array.
+    timelines = [0] * width
+    timelines[start.x] = 1
+    hits = 0
+    for y in range(start.y + 1, height):
+        row = y * width
+        below = timelines.copy()
+        for x, count in enumerate(timelines):
+            if count == 0 or not splitters[row + x]:
                 continue
-            w = splitter.west()
-            e = splitter.east()
-            if w is not None and w.position() not in seen:
-                points.append(w)
-                seen.add(w.position())
-            if e is not None and e.position() not in seen:
-                points.append(e)
-                seen.add(e.position())
-    return len(splitters)
+            hits += 1
+            below[x] -= count
+            if x > 0:
+                below[x - 1] += count
+            if x + 1 < width:
+                below[x + 1] += count
+        timelines = below
+    return hits, sum(timelines)
+
 
-@lru_cache(maxsize=None)
-def p2_recursive(inp: Grid, point: Grid.GridItem[str]):
-    if point.y == inp.size()[1] - 1:
-        return 1
-    east_child = point.east()
-    east_data = 0
-    if east_child is not None:
-        east_data = p2_recursive(inp, east_child.raycast((0, 1), lambda gi: gi.data == "^" or gi.y == inp.size()[1] - 1))
-    west_data = 0
-    west_child = point.west()
-    if west_child is not None:
-        west_data = p2_recursive(inp, west_child.raycast((0, 1), lambda gi: gi.data == "^" or gi.y == inp.size()[1] - 1))
-    return east_data + west_data
+def part1g(inp: Grid):
+    hits, _ = propagate(inp)
+    return hits
 
 
 def part2g(inp: Grid):
-    result = 0
-    start = inp.filter(lambda gi: gi.data == "S")[0]
-    result = p2_recursive(inp, start)
-    return result
+    _, timelines = propagate(inp)
+    return timelines
 
 
 print("TEST DAY 07:")
@@ -1,3 +1,4 @@
+from itertools import islice
 from math import prod, sqrt
 from tqdm import tqdm
 from typing import Tuple
@@ -11,25 +12,23 @@ def distance(p1: Tuple[int, int, int], p2: Tuple[int, int, int]) -> int:
 
 
 def part1(graph: Graph[Tuple[int, int, int]], size=1000):
-    for p1, p2, _ in tqdm(graph.distance_pairs()[:size], desc="Activating edges"):
-        graph.activate_edge(p1, p2)
-    top_3 = sorted(graph.network_sizes(), reverse=True)[:3]
+    for _ in tqdm(islice(graph.kruskal(), size), desc="Activating edges"):
+        pass
+    top_3 = graph.network_sizes(3)
     return prod(top_3)
 
 
 def part2(graph: Graph[Tuple[int, int, int]]):
-    distance_pairs = graph.distance_pairs()
-    while graph.networks_count() > 1:
-        p1, p2, _ = distance_pairs.pop(0)
-        graph.activate_edge(p1, p2)
-    return p1[0] * p2[0]
+    for (p1, p2, _), networks, _ in graph.kruskal():
+        if networks == 1:
+            return p1[0] * p2[0]
 
 
 print("TEST DAY 08:")
 with open("res/day08a.txt") as f:
     lines = f.readlines()
 test_inp = list(map(lambda s: s.strip(), lines))
-test_graph = Graph([], [], distance, autojoin=True, union_find=True)
+test_graph = Graph([], [], distance, autojoin=True, union_find=True, lazy=True)
 for line in tqdm(test_inp, desc="Init graph"):
     x, y, z = ints(line)
     test_graph.add_node((x, y, z))
@@ -41,7 +40,7 @@ print("FINAL DAY 08:")
 with open("res/day08.txt") as f:
     lines = f.readlines()
 inp = list(map(lambda s: s.strip(), lines))
-graph = Graph([], [], distance, autojoin=True, union_find=True)
+graph = Graph([], [], distance, autojoin=True, union_find=True, lazy=True)
 for line in tqdm(inp, desc="Init graph"):
     x, y, z = ints(line)
     graph.add_node((x, y, z))
@@ -1,37 +1,20 @@
-from collections import defaultdict
-from functools import lru_cache
 from typing import List
 
-def part1(inp: List[str]):
-    connections = defaultdict(list)
-    for line in inp:
-        name, rest = line.split(": ")
-        rest = rest.split(" ")
-        connections[name].extend(rest)
-    paths = []
-    def dfs(node: str, path: List[str]):
-        if node == "out":
-            paths.append(path)
-            return
-        for neighbor in connections[node]:
-            dfs(neighbor, path + [neighbor])
-    dfs("you", ["you"])
-    return len(paths)
+from util.graph import Graph
 
-def part2(inp: List[str]):
-    connections = defaultdict(list)
+def parse(inp: List[str]) -> Graph[str]:
+    graph = Graph([], [], lambda a, b: 1, directed=True)
     for line in inp:
         name, rest = line.split(": ")
-        rest = rest.split(" ")
-        connections[name].extend(rest)
-    
-    @lru_cache(maxsize=None)
-    def count_paths(start: str, to: str):
-        if start == to:
-            return 1
-        return sum(count_paths(neighbor, to) for neighbor in connections[start])
+        for neighbor in rest.split(" "):
+            graph.add_edge(name, neighbor)
+    return graph
 
-    return count_paths("svr", "fft") * count_paths("fft", "dac") * count_paths("dac", "out")
+def part1(inp: List[str]):
+    return parse(inp).count_paths("you", "out")
+
+def part2(inp: List[str]):
+    return parse(inp).count_paths("svr", "out", via=["fft", "dac"])
 
 print("TEST DAY 11:")
 test_inp = None
@@ -1,4 +1,5 @@
 from .grid import *
+from .sparse_grid import *
 from .util import *
 from .bfs import *
 from .parser import *
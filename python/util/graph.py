@@ -1,9 +1,660 @@
-from collections import defaultdict
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, deque
+from itertools import chain, islice
 from copy import deepcopy
-from typing import Callable, Dict, Generic, Optional, Set, TypeVar, List, Tuple
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Set,
+    TypeVar,
+    List,
+    Tuple,
+)
+
+try:
+    import numpy as _np
+except ImportError:  # numpy is optional, batch weights fall back to the weight function
+    _np = None
 
 A = TypeVar("A")
 
+# Leaves of the KD-tree hold at most this many points.
+_KD_LEAF_SIZE = 8
+# How many neighbors each point starts with when streaming nearest pairs. The
+# search doubles for a point once its neighbors run out.
+_NEAREST_BATCH = 8
+# How many weights a batch weight function computes at once.
+_BATCH_CELLS = 1 << 22
+# How many edges compact graphs buffer before merging them into the CSR arrays.
+_COMPACT_PENDING = 1 << 16
+
+
+def squared_euclidean(a, b):
+    """
+    Batch weight for the squared Euclidean distances between the rows of an
+    (n, d) and an (m, d) coordinate array, as an (n, m) array. Needs numpy.
+    """
+    res = _np.zeros((len(a), len(b)), dtype=_np.result_type(a, b))
+    for axis in range(a.shape[1]):
+        diff = a[:, axis, None] - b[None, :, axis]
+        res += diff * diff
+    return res
+
+
+def euclidean(a, b):
+    """
+    Batch weight for Euclidean distances, see `squared_euclidean`.
+    """
+    return _np.sqrt(squared_euclidean(a, b))
+
+
+def manhattan(a, b):
+    """
+    Batch weight for Manhattan distances, see `squared_euclidean`.
+    """
+    res = _np.zeros((len(a), len(b)), dtype=_np.result_type(a, b))
+    for axis in range(a.shape[1]):
+        res += _np.abs(a[:, axis, None] - b[None, :, axis])
+    return res
+
+
+class _Networks(Generic[A]):
+    """
+    Disjoint sets of nodes with union by size and path compression.
+
+    The forest is built over integer handles rather than the nodes. Each set's
+    handles form a circular doubly linked list through `next` and `prev`, so
+    merging two sets is O(1) and listing a set is proportional to its size.
+    Detaching part of a set gives the detached nodes fresh handles and unlinks
+    the old ones, which stay behind in the forest so the rest of the set
+    keeps working without being touched. `sizes` counts how many sets there
+    are of each size, which is enough to list the largest sets without
+    sorting every set.
+
+    Active edges are tracked too, split into a spanning forest of the sets
+    and the spare edges inside them.
+    """
+
+    __slots__ = (
+        "handle",
+        "nodes",
+        "parent",
+        "size",
+        "next",
+        "prev",
+        "count",
+        "sizes",
+        "forest",
+        "spare",
+        "shares",
+    )
+
+    def __init__(self):
+        self.handle: Dict[A, int] = dict()
+        # The node for each handle, or None once it has been detached.
+        self.nodes: List[Optional[A]] = list()
+        self.parent: List[int] = list()
+        # Only meaningful for roots.
+        self.size: List[int] = list()
+        self.next: List[int] = list()
+        self.prev: List[int] = list()
+        self.count: int = 0
+        self.sizes: Dict[int, int] = defaultdict(int)
+        self.forest: Dict[A, Set[A]] = defaultdict(set)
+        self.spare: Dict[A, Set[A]] = defaultdict(set)
+        # How many other graphs are using these networks.
+        self.shares: int = 0
+
+    def __contains__(self, node: A) -> bool:
+        return node in self.handle
+
+    def add(self, node: A):
+        if node in self.handle:
+            return
+        self.__new(node)
+        self.count += 1
+        self.sizes[1] += 1
+
+    def __new(self, node: A) -> int:
+        h = len(self.nodes)
+        self.handle[node] = h
+        self.nodes.append(node)
+        self.parent.append(h)
+        self.size.append(1)
+        self.next.append(h)
+        self.prev.append(h)
+        return h
+
+    def find(self, node: A) -> int:
+        """
+        Returns the root handle of a node's set.
+        """
+        parent = self.parent
+        h = root = self.handle[node]
+        while parent[root] != root:
+            root = parent[root]
+        while parent[h] != root:
+            parent[h], h = root, parent[h]
+        return root
+
+    def union(self, node1: A, node2: A) -> bool:
+        """
+        Merges the sets of two nodes, returning False if they were already
+        the same set.
+        """
+        root1, root2 = self.find(node1), self.find(node2)
+        if root1 == root2:
+            return False
+        size, nxt, prev = self.size, self.next, self.prev
+        if size[root1] < size[root2]:
+            root1, root2 = root2, root1
+        size1, size2 = size[root1], size[root2]
+        self.parent[root2] = root1
+        size[root1] = size1 + size2
+        # Splice the lists at the nodes themselves, roots may have been detached.
+        h1, h2 = self.handle[node1], self.handle[node2]
+        after1, after2 = nxt[h1], nxt[h2]
+        nxt[h1], prev[after2] = after2, h1
+        nxt[h2], prev[after1] = after1, h2
+        self.count -= 1
+        self.__resize((size1, size2), (size1 + size2,))
+        return True
+
+    def members(self, node: A) -> Iterable[A]:
+        """
+        Iterates over the nodes in the same set as a node, starting with it.
+        """
+        start = current = self.handle[node]
+        while True:
+            yield self.nodes[current]
+            current = self.next[current]
+            if current == start:
+                return
+
+    def detach(self, nodes: Set[A]):
+        """
+        Splits the given nodes, which must be part but not all of one set,
+        off into a set of their own.
+        """
+        root = self.find(next(iter(nodes)))
+        old = self.size[root]
+        nxt, prev = self.next, self.prev
+        for node in nodes:
+            h = self.handle[node]
+            nxt[prev[h]], prev[nxt[h]] = nxt[h], prev[h]
+            self.nodes[h] = None
+        self.size[root] = old - len(nodes)
+        handles = [self.__new(node) for node in nodes]
+        first = handles[0]
+        self.size[first] = len(handles)
+        for i, h in enumerate(handles):
+            self.parent[h] = first
+            nxt[h] = handles[(i + 1) % len(handles)]
+            prev[h] = handles[i - 1]
+        self.count += 1
+        self.__resize((old,), (old - len(nodes), len(nodes)))
+
+    def largest(self, k: Optional[int] = None) -> List[int]:
+        """
+        Returns the k largest set sizes, or all of them, largest first.
+        """
+        res = []
+        for size in sorted(self.sizes, reverse=True):
+            res.extend([size] * self.sizes[size])
+            if k is not None and len(res) >= k:
+                return res[:k]
+        return res
+
+    def copy(self) -> "_Networks[A]":
+        networks = _Networks()
+        for name in ("handle", "nodes", "parent", "size", "next", "prev", "sizes"):
+            setattr(networks, name, getattr(self, name).copy())
+        networks.count = self.count
+        for name in ("forest", "spare"):
+            adjacency = getattr(networks, name)
+            for node, neighbors in getattr(self, name).items():
+                adjacency[node] = neighbors.copy()
+        return networks
+
+    def __resize(self, removed: Iterable[int], added: Iterable[int]):
+        for size in removed:
+            self.sizes[size] -= 1
+            if self.sizes[size] == 0:
+                del self.sizes[size]
+        for size in added:
+            self.sizes[size] += 1
+
+
+class _DictEdges(Generic[A]):
+    """
+    Edges stored as a dict of dicts from node to neighbor to (weight, active).
+    """
+
+    __slots__ = ("edges", "shares")
+
+    def __init__(self):
+        self.edges: Dict[A, Dict[A, Tuple[int, bool]]] = defaultdict(dict)
+        # How many other graphs are using these edges.
+        self.shares: int = 0
+
+    def get(self, node1: A, node2: A) -> Optional[Tuple[int, bool]]:
+        row = self.edges.get(node1)
+        return None if row is None else row.get(node2)
+
+    def put(self, node1: A, node2: A, weight: int, active: bool):
+        self.edges[node1][node2] = (weight, active)
+
+    def set_active(self, node1: A, node2: A, active: bool) -> bool:
+        """
+        Sets whether an edge is active, returning False if it isn't stored.
+        """
+        row = self.edges.get(node1)
+        if row is None or node2 not in row:
+            return False
+        row[node2] = (row[node2][0], active)
+        return True
+
+    def neighbors(self, node: A) -> Iterable[Tuple[A, int, bool]]:
+        for neighbor, (weight, active) in self.edges.get(node, {}).items():
+            yield neighbor, weight, active
+
+    def sources(self) -> Iterable[A]:
+        """
+        Iterates over the nodes that may have edges leaving them.
+        """
+        return self.edges.keys()
+
+    def copy(self) -> "_DictEdges[A]":
+        edges = _DictEdges()
+        edges.edges = defaultdict(dict)
+        for node, row in self.edges.items():
+            edges.edges[node] = row.copy()
+        return edges
+
+
+class _CompactEdges(Generic[A]):
+    """
+    Edges between nodes interned to dense integer ids, in CSR form: the edges
+    leaving node i are slots starts[i] to starts[i + 1] of the parallel
+    targets, weights and active buffers, sorted by target. Toggling an edge
+    flips a byte in place. New edges and changed weights wait in `pending`
+    and are merged in the next time neighbors are read. Merging builds new
+    buffers, so only the active flags are ever changed in place.
+    """
+
+    __slots__ = (
+        "ids",
+        "nodes",
+        "starts",
+        "targets",
+        "weights",
+        "active",
+        "pending",
+        "shares",
+    )
+
+    def __init__(self):
+        self.ids: Dict[A, int] = dict()
+        self.nodes: List[A] = list()
+        self.starts = array("q", [0])
+        self.targets = array("q")
+        self.weights = array("q")
+        self.active = bytearray()
+        self.pending: Dict[Tuple[int, int], Tuple[int, bool]] = dict()
+        # How many other graphs are using these edges.
+        self.shares: int = 0
+
+    def intern(self, node: A) -> int:
+        i = self.ids.get(node)
+        if i is None:
+            i = self.ids[node] = len(self.nodes)
+            self.nodes.append(node)
+        return i
+
+    def slot(self, i: int, j: int) -> int:
+        """
+        Returns the slot of the edge from id i to id j, or -1 if it isn't in
+        the CSR buffers.
+        """
+        if i + 1 >= len(self.starts):
+            return -1
+        lo, hi = self.starts[i], self.starts[i + 1]
+        k = bisect_left(self.targets, j, lo, hi)
+        return k if k < hi and self.targets[k] == j else -1
+
+    def get(self, node1: A, node2: A) -> Optional[Tuple[int, bool]]:
+        i, j = self.ids.get(node1), self.ids.get(node2)
+        if i is None or j is None:
+            return None
+        edge = self.pending.get((i, j))
+        if edge is not None:
+            return edge
+        k = self.slot(i, j)
+        return None if k < 0 else (self.weights[k], self.active[k] == 1)
+
+    def put(self, node1: A, node2: A, weight: int, active: bool):
+        self.pending[(self.intern(node1), self.intern(node2))] = (weight, active)
+        # Merge once the pending edges rival the CSR ones so they stay compact.
+        if len(self.pending) > max(len(self.targets), _COMPACT_PENDING):
+            self.flush()
+
+    def set_active(self, node1: A, node2: A, active: bool) -> bool:
+        i, j = self.ids.get(node1), self.ids.get(node2)
+        if i is None or j is None:
+            return False
+        edge = self.pending.get((i, j))
+        if edge is not None:
+            self.pending[(i, j)] = (edge[0], active)
+            return True
+        k = self.slot(i, j)
+        if k < 0:
+            return False
+        self.active[k] = active
+        return True
+
+    def row(self, i: int) -> Tuple[int, int]:
+        """
+        Returns the range of slots holding the edges leaving id i.
+        """
+        self.flush()
+        return self.starts[i], self.starts[i + 1]
+
+    def neighbors(self, node: A) -> Iterable[Tuple[A, int, bool]]:
+        i = self.ids.get(node)
+        if i is None:
+            return iter(())
+        lo, hi = self.row(i)
+        return zip(
+            map(self.nodes.__getitem__, self.targets[lo:hi]),
+            self.weights[lo:hi],
+            map(bool, self.active[lo:hi]),
+        )
+
+    def sources(self) -> Iterable[A]:
+        """
+        Iterates over the nodes that may have edges leaving them.
+        """
+        return self.nodes
+
+    def flush(self):
+        """
+        Merges the pending edges into the CSR buffers.
+        """
+        if not self.pending and len(self.starts) == len(self.nodes) + 1:
+            return
+        pending = sorted(self.pending.items())
+        self.pending = dict()
+        starts, targets, weights, active = (
+            self.starts,
+            self.targets,
+            self.weights,
+            self.active,
+        )
+        rows = len(starts) - 1
+        new_starts = array("q", [0])
+        new_targets = array("q")
+        new_weights = list()
+        new_active = bytearray()
+
+        def copy_slots(lo: int, hi: int):
+            new_targets.extend(targets[lo:hi])
+            new_weights.extend(weights[lo:hi])
+            new_active.extend(active[lo:hi])
+
+        def copy_rows(first: int, last: int):
+            # Rows without pending edges are copied over in one go.
+            end = min(last, rows)
+            if first < end:
+                shift = len(new_targets) - starts[first]
+                new_starts.extend(s + shift for s in starts[first + 1 : end + 1])
+                copy_slots(starts[first], starts[end])
+            new_starts.extend([len(new_targets)] * (last - max(first, end)))
+
+        i = p = 0
+        while p < len(pending):
+            row = pending[p][0][0]
+            copy_rows(i, row)
+            k, hi = (starts[row], starts[row + 1]) if row < rows else (0, 0)
+            while p < len(pending) and pending[p][0][0] == row:
+                (_, j), (weight, edge_active) = pending[p]
+                p += 1
+                end = bisect_left(targets, j, k, hi)
+                copy_slots(k, end)
+                # A pending edge replaces the stored one.
+                k = end + 1 if end < hi and targets[end] == j else end
+                new_targets.append(j)
+                new_weights.append(weight)
+                new_active.append(1 if edge_active else 0)
+            copy_slots(k, hi)
+            new_starts.append(len(new_targets))
+            i = row + 1
+        copy_rows(i, len(self.nodes))
+        self.starts = new_starts
+        self.targets = new_targets
+        self.weights = _weights(new_weights)
+        self.active = new_active
+
+    def copy(self) -> "_CompactEdges[A]":
+        edges = _CompactEdges()
+        edges.ids = self.ids.copy()
+        edges.nodes = self.nodes.copy()
+        # The CSR buffers are never changed in place, so they can be shared.
+        edges.starts, edges.targets, edges.weights = (
+            self.starts,
+            self.targets,
+            self.weights,
+        )
+        edges.active = self.active[:]
+        edges.pending = self.pending.copy()
+        return edges
+
+
+def _weights(values: List):
+    """
+    Packs weights into the smallest buffer that holds them, a list if they
+    aren't all numbers.
+    """
+    if all(type(v) is int for v in values):
+        try:
+            return array("q", values)
+        except OverflowError:
+            return values
+    if all(type(v) in (int, float) for v in values):
+        return array("d", values)
+    return values
+
+
+def _has_bit(bits: bytes, i: int) -> bool:
+    return bits[i >> 3] >> (i & 7) & 1 == 1
+
+
+class _KDTree:
+    """
+    A static KD-tree over points given as equal length tuples of numbers.
+
+    The tree is implicit: `order` is a permutation of point indices where each
+    range is split at its midpoint along one axis, cycling through the axes.
+    """
+
+    __slots__ = ("points", "order", "dims")
+
+    def __init__(self, points: Sequence[Sequence[int]]):
+        self.points = points
+        self.order = list(range(len(points)))
+        self.dims = len(points[0]) if len(points) > 0 else 0
+        stack = [(0, len(points), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= _KD_LEAF_SIZE:
+                continue
+            axis = depth % self.dims
+            self.order[lo:hi] = sorted(self.order[lo:hi], key=lambda i: points[i][axis])
+            mid = (lo + hi) // 2
+            stack.append((lo, mid, depth + 1))
+            stack.append((mid + 1, hi, depth + 1))
+
+    def nearest(self, i: int, k: int) -> List[Tuple[int, int]]:
+        """
+        Returns the k points closest to point i as (squared distance, index)
+        pairs in increasing order, leaving out i itself. Ties are broken by
+        index, so asking for more points always extends the same list.
+        """
+        points, order, dims = self.points, self.order, self.dims
+        point = points[i]
+        # Max heap of the best candidates so far, as (-distance, -index).
+        best = []
+
+        def consider(j: int):
+            if j == i:
+                return
+            other = points[j]
+            d = sum([(p - q) * (p - q) for p, q in zip(point, other)])
+            if len(best) < k:
+                heapq.heappush(best, (-d, -j))
+            elif (d, j) < (-best[0][0], -best[0][1]):
+                heapq.heapreplace(best, (-d, -j))
+
+        stack = [(0, len(points), 0, 0)]
+        while stack:
+            lo, hi, depth, bound = stack.pop()
+            if len(best) == k and bound > -best[0][0]:
+                continue
+            if hi - lo <= _KD_LEAF_SIZE:
+                for j in order[lo:hi]:
+                    consider(j)
+                continue
+            axis = depth % dims
+            mid = (lo + hi) // 2
+            consider(order[mid])
+            diff = point[axis] - points[order[mid]][axis]
+            if diff < 0:
+                stack.append((mid + 1, hi, depth + 1, diff * diff))
+                stack.append((lo, mid, depth + 1, 0))
+            else:
+                stack.append((lo, mid, depth + 1, diff * diff))
+                stack.append((mid + 1, hi, depth + 1, 0))
+        return sorted((-d, -j) for d, j in best)
+
+
+def _nearest_pairs(tree: _KDTree) -> Iterator[Tuple[int, int, int]]:
+    """
+    Yields every pair of point indices (i, j) with i < j as (i, j, squared
+    distance), closest first. Each point keeps a short list of its nearest
+    neighbors and a shared heap holds the next unused neighbor of every point,
+    so only as many neighbors are found as the caller consumes.
+    """
+    n = len(tree.points)
+    if n < 2:
+        return
+    neighbors = [tree.nearest(i, min(_NEAREST_BATCH, n - 1)) for i in range(n)]
+    heap = [(found[0][0], i, 0) for i, found in enumerate(neighbors) if found]
+    heapq.heapify(heap)
+    while heap:
+        d, i, rank = heapq.heappop(heap)
+        found = neighbors[i]
+        j = found[rank][1]
+        # Every pair turns up once from each end, keep one of them.
+        if i < j:
+            yield i, j, d
+        rank += 1
+        if rank == len(found) and rank < n - 1:
+            found = neighbors[i] = tree.nearest(i, min(2 * rank, n - 1))
+        if rank < len(found):
+            heapq.heappush(heap, (found[rank][0], i, rank))
+        else:
+            neighbors[i] = None
+
+
+def _batch_band(points, batch_weight, after, k: int):
+    """
+    Finds the k lightest pairs (i, j) with i < j whose weight is above after,
+    plus any ties with the heaviest of them, as arrays of i, j and weight.
+    Weights are computed a block of rows at a time and only the candidates
+    that can still make the cut are kept between blocks.
+    """
+    n = len(points)
+    step = max(1, _BATCH_CELLS // n)
+    bound = None
+    kept = []
+    size = 0
+    for start in range(0, n - 1, step):
+        stop = min(start + step, n)
+        weights = batch_weight(points[start:stop], points[start:])
+        # Row r is point start + r and column c is point start + c.
+        mask = _np.arange(n - start)[None, :] > _np.arange(stop - start)[:, None]
+        if after is not None:
+            mask &= weights > after
+        if bound is not None:
+            mask &= weights <= bound
+        rows, cols = _np.nonzero(mask)
+        kept.append((rows + start, cols + start, weights[rows, cols]))
+        size += len(rows)
+        if size > 2 * k:
+            i, j, w = _cut(*map(_np.concatenate, zip(*kept)), k)
+            kept, size, bound = [(i, j, w)], len(w), w.max()
+    if size == 0:
+        return None
+    return _cut(*map(_np.concatenate, zip(*kept)), k)
+
+
+def _cut(i, j, w, k: int):
+    """
+    Keeps the pairs with the k smallest weights, and any ties with the last.
+    """
+    if len(w) <= k:
+        return i, j, w
+    keep = w <= _np.partition(w, k - 1)[k - 1]
+    return i[keep], j[keep], w[keep]
+
+
+def _batch_pairs(points, batch_weight) -> Iterator[Tuple[int, int, object]]:
+    """
+    Yields every pair of row indices (i, j) with i < j of an (n, d) array as
+    (i, j, weight), lightest first. Pairs are found in bands of the lightest
+    remaining ones, doubling in size each time, so a caller that stops early
+    doesn't pay for sorting every pair.
+    """
+    k = max(4 * len(points), 1024)
+    after = None
+    while True:
+        band = _batch_band(points, batch_weight, after, k)
+        if band is None:
+            return
+        i, j, w = band
+        order = _np.lexsort((j, i, w))
+        yield from zip(i[order].tolist(), j[order].tolist(), w[order].tolist())
+        after = w.max()
+        k *= 2
+
+
+def _weight_pairs(
+    nodes: List[A], weight: Callable[[A, A], int]
+) -> Iterator[Tuple[int, int, int]]:
+    """
+    `_batch_pairs` without numpy, calling the weight function for each pair.
+    """
+    k = max(4 * len(nodes), 1024)
+    last = None
+    while True:
+        pairs = (
+            (weight(nodes[i], nodes[j]), i, j)
+            for i in range(len(nodes))
+            for j in range(i + 1, len(nodes))
+        )
+        band = heapq.nsmallest(k, (p for p in pairs if last is None or p > last))
+        if len(band) == 0:
+            return
+        yield from ((i, j, w) for w, i, j in band)
+        last = band[-1]
+        k *= 2
+
 
 class Graph(Generic[A]):
     """
@@ -12,8 +663,11 @@ class Graph(Generic[A]):
     Supports:
     - Adding nodes and edges
     - Activating and deactivating edges
-    - Union find ("networks", only works on undirected graphs)
+    - Union find ("networks", only works on undirected graphs), with O(1)
+      network counts
     - Autojoin (adds an edge between all nodes)
+    - Lazy autojoin for points, which finds edges nearest first instead of
+      storing all of them, optionally with vectorized batch weights
     - Directed and undirected graphs
     - Weighted and unweighted graphs
     - Minimum and maximum distances between all nodes
@@ -29,8 +683,42 @@ class Graph(Generic[A]):
         union_find: bool = False,
         default_active: bool = False,
         directed: bool = False,
+        lazy: bool = False,
+        batch_weight: Optional[Callable] = None,
+        compact: bool = False,
     ):
+        """
+        If lazy and autojoin are set, joined edges aren't stored. Instead
+        `sorted_edges` finds them nearest first with a KD-tree over the nodes,
+        so nodes must be tuples of coordinates and the weight must grow with
+        the Euclidean distance between them. Edges from lazy autojoin start
+        inactive.
+
+        A batch weight such as `squared_euclidean` also makes autojoin lazy,
+        but works for any weight. It takes (n, d) and (m, d) arrays of nodes
+        and returns the (n, m) array of weights between them, which must match
+        the weight function. `sorted_edges` then computes weights in blocks
+        with numpy, keeping only compact arrays of the lightest pairs. Without
+        numpy the weight function is used instead.
+
+        If compact is set, nodes are interned to integer ids and edges are
+        kept in CSR arrays with the weights and active flags in flat buffers,
+        which takes a fraction of the memory of the default dict of dicts and
+        makes `neighbors` iterate over contiguous slices. Adding edges is
+        batched up until the next traversal.
+
+        Example:
+        ```
+        Graph([], [], weight, autojoin=True, batch_weight=squared_euclidean)
+        ```
+        """
+        lazy = lazy or batch_weight is not None
+        if lazy and autojoin and default_active:
+            raise ValueError("Lazy autojoin edges can't start active")
         self.__autojoin: bool = autojoin
+        self.__lazy: bool = lazy and autojoin
+        self.__batch_weight: Optional[Callable] = batch_weight
+        self.__index: Optional[_KDTree] = None
         self.__union_find: bool = union_find
         self.__default_active: bool = default_active
         self.__directed: bool = directed
@@ -38,24 +726,50 @@ class Graph(Generic[A]):
         self.__sort_dirty: bool = True
 
         self.__nodes: List[A] = deepcopy(nodes)
-        self.__edges: Dict[A, Dict[A, int]] = defaultdict(dict)
+        self.__edges: _DictEdges[A] | _CompactEdges[A] = (
+            _CompactEdges() if compact else _DictEdges()
+        )
 
+        active_edges = []
         for edge in edges:
             if len(edge) == 2:
-                self.__edges[edge[0]][edge[1]] = (
+                self.__edges.put(
+                    edge[0],
+                    edge[1],
                     weight(edge[0], edge[1]),
                     default_active,
                 )
             elif len(edge) == 3:
-                self.__edges[edge[0]][edge[1]] = (edge[2], default_active)
+                self.__edges.put(edge[0], edge[1], edge[2], default_active)
             else:
-                self.__edges[edge[0]][edge[1]] = (edge[2], edge[3])
+                self.__edges.put(edge[0], edge[1], edge[2], edge[3])
+            if edge[3] if len(edge) == 4 else default_active:
+                active_edges.append((edge[0], edge[1]))
 
-        self.__min_distances: List[Tuple[A, A, int]] = list()
-        self.__max_distances: List[Tuple[A, A, int]] = list()
-        self.__network_contents: List[Set[A]] = list()
-        self.__networks: Dict[A, int] = dict()
-        if autojoin:
+        # Every edge once, sorted by weight when __sort_dirty is False. Sorting
+        # builds a new list so iterators over the old one aren't disturbed.
+        self.__distances: List[Tuple[A, A, int]] = list()
+        self.__networks: _Networks[A] = _Networks()
+        # Lists shared with clones, which are copied before appending to them.
+        self.__shared: Set[str] = set()
+        # The topological order, each node's position in it and the path
+        # counts to each target asked about, until the graph changes.
+        self.__paths: Optional[
+            Tuple[List[A], Dict[A, int], Dict[A, Dict[A, int]]]
+        ] = None
+        # The strongly connected components, the component of each node and
+        # the edges between components, until the graph changes.
+        self.__components: Optional[
+            Tuple[List[List[A]], Dict[A, int], List[Dict[int, int]]]
+        ] = None
+        # Bitsets of the components each component reaches and is reached from.
+        self.__closure: Optional[Tuple[List[bytes], List[bytes]]] = None
+        for node in nodes:
+            self.__networks.add(node)
+        if union_find and not directed:
+            for node1, node2 in active_edges:
+                self.__join(node1, node2)
+        if autojoin and not self.__lazy:
             for node1 in nodes:
                 for node2 in nodes:
                     if node1 == node2:
@@ -67,10 +781,12 @@ class Graph(Generic[A]):
         Adds a node to the graph.
         If autojoin is enabled, adds an edge between the new node and all other nodes.
         """
+        self.__unshare("nodes")
         self.__nodes.append(node)
-        self.__networks[node] = len(self.__network_contents)
-        self.__network_contents.append(set([node]))
-        if self.__autojoin:
+        self.__changed()
+        self.__writable_networks().add(node)
+        self.__index = None
+        if self.__autojoin and not self.__lazy:
             for node1 in self.__nodes:
                 if node1 == node:
                     continue
@@ -93,123 +809,529 @@ class Graph(Generic[A]):
             active = self.__default_active
         if weight is None:
             weight = self.__weight(node1, node2)
-        self.__edges[node1][node2] = (weight, active)
+        existing = self.__edges.get(node1, node2)
+        if existing is not None and existing[1]:
+            self.deactivate_edge(node1, node2)
+        edges = self.__writable_edges()
+        edges.put(node1, node2, weight, False)
         if not self.__directed:
-            self.__edges[node2][node1] = (weight, active)
+            edges.put(node2, node1, weight, False)
         if active:
             self.activate_edge(node1, node2)
-        self.__min_distances.append((node1, node2, weight))
-        self.__max_distances.append((node1, node2, weight))
+        self.__unshare("distances")
+        self.__distances.append((node1, node2, weight))
+        self.__changed()
         self.__sort_dirty = True
 
     def has_edge(self, node1: A, node2: A) -> bool:
         """
         Returns True if there is an edge between two nodes.
         """
-        return node1 in self.__edges and node2 in self.__edges[node1]
+        if self.__lazy and self.__joined(node1, node2):
+            return True
+        return self.__edges.get(node1, node2) is not None
 
     def edge_weight(self, node1: A, node2: A) -> int:
         """
         Returns the weight of an edge between two nodes.
         """
-        return self.__edges[node1][node2][0]
+        return self.__edge(node1, node2)[0]
 
     def edge_active(self, node1: A, node2: A) -> bool:
         """
         Returns True if an edge between two nodes is active.
         """
-        return self.__edges[node1][node2][1]
+        return self.__edge(node1, node2)[1]
+
+    def __joined(self, node1: A, node2: A) -> bool:
+        return node1 != node2 and node1 in self.__networks and node2 in self.__networks
+
+    def __edge(self, node1: A, node2: A) -> Tuple[int, bool]:
+        """
+        Returns the (weight, active) pair of an edge, including lazily joined
+        edges that haven't been stored.
+        """
+        edge = self.__edges.get(node1, node2)
+        if edge is None and self.__lazy and self.__joined(node1, node2):
+            edge = (self.__weight(node1, node2), False)
+        if edge is None:
+            raise KeyError((node1, node2))
+        return edge
 
     def distance_pairs(self, min=True):
         """
         Returns a list of distance pairs between all nodes.
         If min is True, returns the list of minimum distances between all nodes.
         If min is False, returns the list of maximum distances between all nodes.
+
+        This copies the list, prefer `sorted_edges` or `smallest` when only
+        iterating or taking the first few edges.
+        """
+        return list(self.sorted_edges(min))
+
+    def sorted_edges(self, min=True) -> Iterator[Tuple[A, A, int]]:
+        """
+        Iterates over the edges as (node1, node2, weight), lightest first, or
+        heaviest first if min is False. Edges are sorted once and then shared
+        between iterators, nothing is copied.
+
+        With lazy autojoin, joined edges are found as they're consumed, so
+        taking the first few edges of a large graph is cheap. Nodes and edges
+        added while iterating aren't included.
+
+        Example:
+        ```
+        for node1, node2, _ in graph.sorted_edges():
+            graph.activate_edge(node1, node2)
+            if graph.networks_count() == 1:
+                break
+        ```
+        """
+        edges = self.__sorted_distances()
+        if not self.__lazy:
+            yield from islice(edges, len(edges)) if min else reversed(edges)
+            return
+        if not min:
+            raise ValueError("Lazy autojoin only finds minimum distances")
+        if self.__batch_weight is not None:
+            nodes = list(self.__nodes)
+            if _np is not None and len(nodes) > 0:
+                pairs = _batch_pairs(_np.array(nodes), self.__batch_weight)
+            else:
+                pairs = _weight_pairs(nodes, self.__weight)
+            joined = (
+                (nodes[i], nodes[j], w) for i, j, w in pairs if nodes[i] != nodes[j]
+            )
+        else:
+            if self.__index is None:
+                self.__index = _KDTree(list(self.__nodes))
+            nodes, weight = self.__index.points, self.__weight
+            joined = (
+                (nodes[i], nodes[j], weight(nodes[i], nodes[j]))
+                for i, j, _ in _nearest_pairs(self.__index)
+                if nodes[i] != nodes[j]
+            )
+        yield from heapq.merge(joined, islice(edges, len(edges)), key=lambda x: x[2])
+
+    def smallest(self, k: int, min=True) -> List[Tuple[A, A, int]]:
+        """
+        Returns the k lightest edges, or the k heaviest if min is False,
+        ordered by weight. If the edges haven't been sorted yet only the k
+        edges are selected and sorted.
+        """
+        if self.__lazy or not self.__sort_dirty:
+            return list(islice(self.sorted_edges(min), k))
+        select = heapq.nsmallest if min else heapq.nlargest
+        return select(k, self.__distances, key=lambda x: x[2])
+
+    def kruskal(
+        self,
+    ) -> Iterator[Tuple[Tuple[A, A, int], int, Optional[Tuple[int, int]]]]:
+        """
+        Runs Kruskal's algorithm over `sorted_edges`, yielding an event for
+        every edge considered as (edge, networks remaining, merged sizes).
+        Edges that join two networks are activated and merged sizes holds the
+        sizes of the two networks before the merge. Otherwise it's None.
+
+        Every edge is yielded, so stop iterating once you have what you need.
+
+        Example:
+        ```
+        for (node1, node2, _), networks, _ in graph.kruskal():
+            if networks == 1:
+                break
+        ```
         """
+        if not self.__union_find or self.__directed:
+            raise ValueError("Union find is not enabled")
+        for edge in self.sorted_edges():
+            node1, node2, _ = edge
+            networks = self.__writable_networks()
+            networks.add(node1)
+            networks.add(node2)
+            root1, root2 = networks.find(node1), networks.find(node2)
+            merged = None
+            if root1 != root2:
+                merged = (networks.size[root1], networks.size[root2])
+                self.activate_edge(node1, node2)
+            yield edge, networks.count, merged
+
+    def __sorted_distances(self) -> List[Tuple[A, A, int]]:
         if self.__sort_dirty:
-            self.__min_distances.sort(key=lambda x: x[2])
-            self.__max_distances.sort(key=lambda x: x[2])
+            self.__distances = sorted(self.__distances, key=lambda x: x[2])
+            self.__shared.discard("distances")
             self.__sort_dirty = False
-        if min:
-            return deepcopy(self.__min_distances)
-        return deepcopy(self.__max_distances)
+        return self.__distances
 
     def activate_edge(self, node1: A, node2: A):
         """
         Activates an edge between two nodes.
         If union find is enabled, merges the networks of the two nodes if they are in the same network.
         """
-        self.__edges[node1][node2] = (self.__edges[node1][node2][0], True)
-        if not self.__directed:
-            self.__edges[node2][node1] = (self.__edges[node2][node1][0], True)
+        was_active = self.__edge(node1, node2)[1]
+        self.__set_active(node1, node2, True)
 
         # update networks
-        if self.__union_find and not self.__directed:
-            if node1 in self.__networks and node2 in self.__networks:
-                if self.__networks[node1] == self.__networks[node2]:
-                    # same network, do nothing
-                    return
-                else:
-                    # merge networks
-                    old_network_idx = self.__networks[node2]
-                    self.__network_contents[self.__networks[node1]].update(
-                        self.__network_contents[self.__networks[node2]]
-                    )
-                    for node in self.__network_contents[self.__networks[node2]]:
-                        self.__networks[node] = self.__networks[node1]
-                    # Use a none value to mark the network as deleted
-                    self.__network_contents[old_network_idx] = None
-            elif node1 in self.__networks:
-                # add node2 to network of node1
-                self.__networks[node2] = self.__networks[node1]
-                self.__network_contents[self.__networks[node1]].add(node2)
-            else:  # node2 in self.__networks
-                # add node1 to network of node2
-                self.__networks[node1] = self.__networks[node2]
-                self.__network_contents[self.__networks[node2]].add(node1)
+        if self.__union_find and not self.__directed and not was_active:
+            self.__join(node1, node2)
+
+    def __join(self, node1: A, node2: A):
+        """
+        Merges the networks of the two ends of a newly active edge, filing the
+        edge under the spanning forest if it merged them and the spare edges
+        if it didn't.
+        """
+        networks = self.__writable_networks()
+        if node2 in networks.forest[node1] or node2 in networks.spare[node1]:
+            return
+        networks.add(node1)
+        networks.add(node2)
+        if networks.union(node1, node2):
+            networks.forest[node1].add(node2)
+            networks.forest[node2].add(node1)
+        else:
+            networks.spare[node1].add(node2)
+            networks.spare[node2].add(node1)
 
     def deactivate_edge(self, node1: A, node2: A):
         """
         Deactivates an edge between two nodes.
 
-        If union find is enabled, verifies which nodes are reachable from node1
-        and node2 and splits the network if necessary.
+        If union find is enabled, splits the network if node1 and node2 are no
+        longer connected. Active edges are split into a spanning forest and
+        spare edges, so only removing a forest edge needs a search, and that
+        only covers the smaller of the two trees it leaves behind.
         """
-        self.__edges[node1][node2] = (self.__edges[node1][node2][0], False)
-        if not self.__directed:
-            self.__edges[node2][node1] = (self.__edges[node2][node1][0], False)
+        was_active = self.__edge(node1, node2)[1]
+        self.__set_active(node1, node2, False)
         # update networks
-        if self.__union_find and not self.__directed:
-            if node1 not in self.__networks or node2 not in self.__networks:
+        if self.__union_find and not self.__directed and was_active:
+            networks = self.__networks
+            if node1 not in networks or node2 not in networks:
                 return
-            if self.__networks[node1] != self.__networks[node2]:
+            if networks.find(node1) != networks.find(node2):
                 return
-            # BFS from node1 to find reachable component and check if node2 is in it
-            node1_component: Set[A] = {node1}
-            queue: List[A] = [node1]
-            while queue:
-                current = queue.pop(0)
-                for neighbor, (_, active) in self.__edges.get(current, {}).items():
-                    if active and neighbor not in node1_component:
-                        node1_component.add(neighbor)
-                        queue.append(neighbor)
-            if node2 in node1_component:
+            networks = self.__writable_networks()
+            forest, spare = networks.forest, networks.spare
+            if node2 in spare[node1]:
+                spare[node1].discard(node2)
+                spare[node2].discard(node1)
                 return
+            if node2 not in forest[node1]:
+                return
+            forest[node1].discard(node2)
+            forest[node2].discard(node1)
+            # Look for a spare edge that reconnects the two trees
+            smaller = self.__smaller_tree(node1, node2)
+            for node in smaller:
+                for neighbor in spare[node]:
+                    if neighbor not in smaller:
+                        spare[node].discard(neighbor)
+                        spare[neighbor].discard(node)
+                        forest[node].add(neighbor)
+                        forest[neighbor].add(node)
+                        return
             # Split the network
-            old_network_idx = self.__networks[node1]
-            node2_component = self.__network_contents[old_network_idx] - node1_component
-            self.__network_contents[old_network_idx] = node1_component
-            new_network_idx = len(self.__network_contents)
-            self.__network_contents.append(node2_component)
-            for node in node2_component:
-                self.__networks[node] = new_network_idx
+            networks.detach(smaller)
+
+    def __set_active(self, node1: A, node2: A, active: bool):
+        pairs = [(node1, node2)]
+        if not self.__directed:
+            pairs.append((node2, node1))
+        for node1, node2 in pairs:
+            edges = self.__writable_edges()
+            if not edges.set_active(node1, node2, active):
+                edges.put(node1, node2, self.__edge(node1, node2)[0], active)
+
+    def neighbors(self, node: A, active: Optional[bool] = None) -> Iterator[A]:
+        """
+        Iterates over the stored edges leaving a node, only the active or
+        inactive ones if active is given. Lazily joined edges are only
+        included once they've been stored by activating them.
+        """
+        for neighbor, _, edge_active in self.__edges.neighbors(node):
+            if active is None or edge_active == active:
+                yield neighbor
+
+    def __smaller_tree(self, node1: A, node2: A) -> Set[A]:
+        """
+        Searches the spanning trees containing two nodes in lockstep and
+        returns the nodes of whichever is smaller.
+        """
+        seen = ({node1}, {node2})
+        queues = (deque([node1]), deque([node2]))
+        while True:
+            for side in (0, 1):
+                if not queues[side]:
+                    return seen[side]
+                for neighbor in self.__networks.forest[queues[side].popleft()]:
+                    if neighbor not in seen[side]:
+                        seen[side].add(neighbor)
+                        queues[side].append(neighbor)
+
+    def topological_order(self) -> List[A]:
+        """
+        Returns the nodes in topological order over the stored edges, using
+        Kahn's algorithm. Raises a ValueError naming a cycle if there is one.
+        """
+        return list(self.__path_index()[0])
+
+    def count_paths(
+        self, src: A, dst: A, via: Iterable[A] = (), any_order: bool = False
+    ) -> int:
+        """
+        Counts the paths from src to dst over the stored edges of a directed
+        acyclic graph. If via is given, only counts paths that pass through
+        each of those nodes, in order unless any_order is set.
+
+        The graph is sorted topologically once and the number of paths to
+        each target from every node is kept, so later queries are cheap until
+        the graph changes. Raises a ValueError naming a cycle if there is one.
+
+        Example:
+        ```
+        graph.count_paths("svr", "out", via=["fft", "dac"])
+        ```
+        """
+        _, position, _ = self.__path_index()
+        via = list(via)
+        if any_order:
+            # A path can only pass through the nodes in topological order.
+            via.sort(key=lambda node: position.get(node, -1))
+        stops = [src, *via, dst]
+        total = 1
+        for start, end in zip(stops, stops[1:]):
+            total *= self.__paths_to(end).get(start, 0)
+            if total == 0:
+                break
+        return total
+
+    def __path_index(self) -> Tuple[List[A], Dict[A, int], Dict[A, Dict[A, int]]]:
+        if self.__paths is None:
+            order = self.__kahn()
+            self.__paths = (order, {node: i for i, node in enumerate(order)}, {})
+        return self.__paths
+
+    def __paths_to(self, target: A) -> Dict[A, int]:
+        """
+        Returns the number of paths from each node to a target, leaving out
+        nodes that can't reach it.
+        """
+        order, position, tables = self.__path_index()
+        counts = tables.get(target)
+        if counts is None:
+            counts = tables[target] = dict()
+            if target in position:
+                counts[target] = 1
+                # Only nodes before the target in the order can reach it.
+                for node in reversed(order[: position[target]]):
+                    total = sum(
+                        counts.get(neighbor, 0)
+                        for neighbor, _, _ in self.__edges.neighbors(node)
+                    )
+                    if total > 0:
+                        counts[node] = total
+        return counts
+
+    def __kahn(self) -> List[A]:
+        edges = self.__edges
+        indegree: Dict[A, int] = dict.fromkeys(chain(self.__nodes, edges.sources()), 0)
+        for node in list(indegree):
+            for neighbor, _, _ in edges.neighbors(node):
+                indegree[neighbor] = indegree.get(neighbor, 0) + 1
+        queue = deque(node for node, count in indegree.items() if count == 0)
+        order = []
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for neighbor, _, _ in edges.neighbors(node):
+                indegree[neighbor] -= 1
+                if indegree[neighbor] == 0:
+                    queue.append(neighbor)
+        if len(order) < len(indegree):
+            cycle = " -> ".join(map(str, self.__cycle(indegree)))
+            raise ValueError(f"Graph has a cycle: {cycle}")
+        return order
+
+    def __cycle(self, indegree: Dict[A, int]) -> List[A]:
+        """
+        Finds a cycle among the nodes Kahn's algorithm couldn't order. Each
+        of them has a predecessor among them, so walking back from any of
+        them has to loop.
+        """
+        remaining = {node for node, count in indegree.items() if count > 0}
+        previous = dict()
+        for node in remaining:
+            for neighbor, _, _ in self.__edges.neighbors(node):
+                if neighbor in remaining:
+                    previous[neighbor] = node
+        walk: Dict[A, int] = dict()
+        node = next(iter(remaining))
+        while node not in walk:
+            walk[node] = len(walk)
+            node = previous[node]
+        cycle = list(walk)[walk[node] :][::-1]
+        return cycle + cycle[:1]
 
-    def networks_contents(self, node: A) -> List[Set[A]]:
+    def strongly_connected_components(self) -> List[List[A]]:
+        """
+        Returns the strongly connected components of the stored edges, found
+        with an iterative version of Tarjan's algorithm. Components come in
+        topological order, edges only lead from a component to later ones.
+        """
+        return [list(component) for component in self.__scc()[0]]
+
+    def condensation(self) -> "Graph[int]":
+        """
+        Returns the directed acyclic graph of the strongly connected
+        components, with nodes numbered as in `strongly_connected_components`.
+        Each edge has the weight of the lightest edge it stands for.
+        """
+        components, _, successors = self.__scc()
+        edges = [
+            (c, d, weight)
+            for c, targets in enumerate(successors)
+            for d, weight in targets.items()
+        ]
+        return Graph(list(range(len(components))), edges, self.__weight, directed=True)
+
+    def can_reach(self, src: A, dst: A) -> bool:
+        """
+        Returns True if there is a path from src to dst over the stored
+        edges. The first query builds a bitset of the components each
+        component can reach, taking a bit per pair of components, after
+        which each query is O(1).
+        """
+        _, component, _ = self.__scc()
+        if src not in component or dst not in component:
+            return False
+        reach, _ = self.__reachability()
+        return _has_bit(reach[component[src]], component[dst])
+
+    def between(
+        self, src: A, dst: A, waypoints: Optional[Iterable[A]] = None
+    ) -> Set[A]:
+        """
+        Returns the nodes that lie on some path from src to dst, or just the
+        ones among waypoints. Uses the same index as `can_reach`, checking a
+        waypoint is O(1) and finding every node is O(n / 64).
+        """
+        components, component, _ = self.__scc()
+        if src not in component or dst not in component:
+            return set()
+        reach, reached = self.__reachability()
+        c, d = component[src], component[dst]
+        if waypoints is not None:
+            return {
+                node
+                for node in waypoints
+                if node in component
+                and _has_bit(reach[c], component[node])
+                and _has_bit(reached[d], component[node])
+            }
+        bits = int.from_bytes(reach[c], "little") & int.from_bytes(reached[d], "little")
+        res = set()
+        while bits:
+            low = bits & -bits
+            res.update(components[low.bit_length() - 1])
+            bits ^= low
+        return res
+
+    def __changed(self):
+        self.__paths = None
+        self.__components = None
+        self.__closure = None
+
+    def __scc(self) -> Tuple[List[List[A]], Dict[A, int], List[Dict[int, int]]]:
+        if self.__components is not None:
+            return self.__components
+        edges = self.__edges
+        nodes = list(dict.fromkeys(chain(self.__nodes, edges.sources())))
+        index: Dict[A, int] = dict()
+        low: Dict[A, int] = dict()
+        stack: List[A] = list()
+        on_stack: Set[A] = set()
+        components: List[List[A]] = list()
+        # The nodes being visited with iterators over their remaining edges.
+        work: List[Tuple[A, Iterator[Tuple[A, int, bool]]]] = list()
+
+        def visit(node: A):
+            index[node] = low[node] = len(index)
+            stack.append(node)
+            on_stack.add(node)
+            work.append((node, iter(edges.neighbors(node))))
+
+        for root in nodes:
+            if root in index:
+                continue
+            visit(root)
+            while work:
+                node, neighbors = work[-1]
+                for neighbor, _, _ in neighbors:
+                    if neighbor not in index:
+                        visit(neighbor)
+                        break
+                    if neighbor in on_stack:
+                        low[node] = min(low[node], index[neighbor])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index[node]:
+                        # node is the root of a component, pop it off.
+                        members = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            members.append(member)
+                            if member == node:
+                                break
+                        components.append(members)
+        # Tarjan finds components in reverse topological order.
+        components.reverse()
+        component = {
+            node: c for c, members in enumerate(components) for node in members
+        }
+        successors: List[Dict[int, int]] = [dict() for _ in components]
+        for c, members in enumerate(components):
+            for node in members:
+                for neighbor, weight, _ in edges.neighbors(node):
+                    d = component[neighbor]
+                    if d != c and (d not in successors[c] or weight < successors[c][d]):
+                        successors[c][d] = weight
+        self.__components = (components, component, successors)
+        return self.__components
+
+    def __reachability(self) -> Tuple[List[bytes], List[bytes]]:
+        """
+        Returns bitsets of the components each component reaches and is
+        reached from, both including itself.
+        """
+        if self.__closure is None:
+            components, _, successors = self.__scc()
+            count = len(components)
+            reach = [1 << c for c in range(count)]
+            reached = list(reach)
+            for c in reversed(range(count)):
+                for d in successors[c]:
+                    reach[c] |= reach[d]
+            for c in range(count):
+                for d in successors[c]:
+                    reached[d] |= reached[c]
+            size = (count + 7) // 8
+            self.__closure = (
+                [bits.to_bytes(size, "little") for bits in reach],
+                [bits.to_bytes(size, "little") for bits in reached],
+            )
+        return self.__closure
+
+    def networks_contents(self, node: A) -> Set[A]:
         """
         Returns the contents of the network of a node.
         """
         if self.__union_find and not self.__directed:
-            return self.__network_contents[self.__networks[node]]
+            return set(self.__networks.members(node))
         else:
             raise ValueError("Union find is not enabled")
 
@@ -218,7 +1340,7 @@ class Graph(Generic[A]):
         Returns the number of networks in the graph.
         """
         if self.__union_find and not self.__directed:
-            return len(list(filter(lambda x: x is not None, self.__network_contents)))
+            return self.__networks.count
         else:
             raise ValueError("Union find is not enabled")
 
@@ -227,42 +1349,73 @@ class Graph(Generic[A]):
         Returns the size of the network of a node.
         """
         if self.__union_find and not self.__directed:
-            return len(self.__network_contents[self.__networks[node]])
+            return self.__networks.size[self.__networks.find(node)]
         else:
             raise ValueError("Union find is not enabled")
         
-    def network_sizes(self) -> List[int]:
+    def network_sizes(self, k: Optional[int] = None) -> List[int]:
         """
-        Returns the sizes of all networks in the graph.
+        Returns the sizes of the networks in the graph, largest first.
+        If k is given, returns only the k largest sizes.
         """
         if self.__union_find and not self.__directed:
-            return list(map(len, list(filter(lambda x: x is not None, self.__network_contents))))
+            return self.__networks.largest(k)
         else:
             raise ValueError("Union find is not enabled")
         
     def clone(self) -> "Graph[A]":
         """
         Returns a clone of the graph.
+
+        Cloning is O(1): the clone shares its nodes, edges, sorted edges and
+        networks with this graph, and whichever graph changes one of them
+        first takes its own copy. Compact graphs only copy their active flags
+        and keep sharing the CSR arrays.
         """
-        g = Graph(
-            self.__nodes,
-            self.__edges,
-            self.__weight,
-            False,
-            False,
-            False,
-            False
-        )
+        g = Graph.__new__(Graph)
         g.__autojoin = self.__autojoin
+        g.__lazy = self.__lazy
+        g.__batch_weight = self.__batch_weight
+        g.__index = self.__index
         g.__union_find = self.__union_find
         g.__default_active = self.__default_active
         g.__directed = self.__directed
         g.__weight = self.__weight
         g.__sort_dirty = self.__sort_dirty
-        g.__nodes = deepcopy(self.__nodes)
-        g.__edges = deepcopy(self.__edges)
-        g.__min_distances = deepcopy(self.__min_distances)
-        g.__max_distances = deepcopy(self.__max_distances)
-        g.__network_contents = deepcopy(self.__network_contents)
-        g.__networks = deepcopy(self.__networks)
-        return g
\ No newline at end of file
+        g.__nodes = self.__nodes
+        g.__edges = self.__edges
+        g.__distances = self.__distances
+        g.__networks = self.__networks
+        g.__paths = self.__paths
+        g.__components = self.__components
+        g.__closure = self.__closure
+        self.__edges.shares += 1
+        self.__networks.shares += 1
+        self.__shared = {"nodes", "distances"}
+        g.__shared = {"nodes", "distances"}
+        return g
+
+    def __unshare(self, name: str):
+        """
+        Copies the nodes or distances list if it's shared with a clone.
+        """
+        if name in self.__shared:
+            self.__shared.discard(name)
+            if name == "nodes":
+                self.__nodes = list(self.__nodes)
+            else:
+                self.__distances = list(self.__distances)
+
+    def __writable_edges(self) -> "_DictEdges[A] | _CompactEdges[A]":
+        if self.__edges.shares > 0:
+            # Another graph is still using these edges, so take a copy first.
+            self.__edges.shares -= 1
+            self.__edges = self.__edges.copy()
+        return self.__edges
+
+    def __writable_networks(self) -> _Networks[A]:
+        if self.__networks.shares > 0:
+            # Another graph is still using these networks, so take a copy first.
+            self.__networks.shares -= 1
+            self.__networks = self.__networks.copy()
+        return self.__networks
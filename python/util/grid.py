@@ -1,4 +1,27 @@
-from typing import Callable, Generic, Iterable, List, Set, Tuple, TypeVar, Union
+import mmap
+import re
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import shared_memory
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+try:
+    import numpy as _np
+except ImportError:  # numpy is optional, everything falls back to pure python
+    _np = None
 
 
 A = TypeVar("A")
@@ -17,13 +40,460 @@ def _curry_filter(filter):
     )
 
 
+class _ObjectCells:
+    """
+    Flat, row-major cell storage for arbitrary python values.
+    """
+
+    __slots__ = ("buf", "shares", "index")
+
+    bytewise = False
+
+    def __init__(self, buf: list):
+        self.buf = buf
+        # How many other grids besides the first are using this storage.
+        self.shares = 0
+        # Optional map of value -> set of cell ids holding it.
+        self.index = None
+
+    def get(self, i: int):
+        return self.buf[i]
+
+    def set(self, i: int, value):
+        self.buf[i] = value
+
+    def values(self) -> list:
+        return list(self.buf)
+
+    def __iter__(self):
+        return iter(self.buf)
+
+    def copy(self) -> "_ObjectCells":
+        return _ObjectCells(self.buf.copy())
+
+    def widen(self) -> "_ObjectCells":
+        """
+        Returns writable storage that can hold any value.
+        """
+        return _ObjectCells(self.values())
+
+    def numpy(self):
+        return None
+
+
+class _ByteCells(_ObjectCells):
+    """
+    Flat cell storage for single-character strings, one byte per cell.
+    """
+
+    __slots__ = ()
+
+    bytewise = True
+
+    def get(self, i: int) -> str:
+        return chr(self.buf[i])
+
+    def set(self, i: int, value: str):
+        self.buf[i] = ord(value)
+
+    def values(self) -> List[str]:
+        return list(self.buf.decode("latin-1"))
+
+    def __iter__(self):
+        return map(chr, self.buf)
+
+    def present(self) -> Iterable[int]:
+        """
+        The distinct byte values stored.
+        """
+        return _np.unique(self.numpy()) if _np is not None else set(self.buf)
+
+    def translate(self, table: bytes) -> bytes:
+        return self.buf.translate(table)
+
+    def copy(self) -> "_ByteCells":
+        return _ByteCells(bytearray(self.buf))
+
+    def numpy(self):
+        return _np.frombuffer(self.buf, dtype=_np.uint8) if _np is not None else None
+
+
+class _IntCells(_ObjectCells):
+    """
+    Flat cell storage for integers that fit in a signed 64-bit machine word.
+    """
+
+    __slots__ = ()
+
+    def set(self, i: int, value: int):
+        if type(value) is not int:
+            raise TypeError("int cells can only hold ints")
+        self.buf[i] = value
+
+    def values(self) -> List[int]:
+        return self.buf.tolist()
+
+    def copy(self) -> "_IntCells":
+        return _IntCells(array("q", self.buf))
+
+    def numpy(self):
+        return _np.frombuffer(self.buf, dtype=_np.int64) if _np is not None else None
+
+
+class _MappedCells(_ObjectCells):
+    """
+    Read-only cells backed by a memory-mapped text file. Lines are found
+    through an index of byte offsets and parsed a row at a time the first
+    time a cell in that row is read.
+    """
+
+    __slots__ = ("starts", "ends", "width", "parse_row", "rows")
+
+    def __init__(
+        self,
+        buf: mmap.mmap,
+        starts: array,
+        ends: array,
+        width: int,
+        parse_row: Optional[Callable[[memoryview, int], list]] = None,
+    ):
+        self.buf = buf
+        self.shares = 0
+        self.index = None
+        self.starts = starts
+        self.ends = ends
+        self.width = width
+        self.parse_row = parse_row
+        self.rows = {}
+
+    def row(self, y: int) -> memoryview:
+        """
+        The raw bytes of a line, without copying them.
+        """
+        return memoryview(self.buf)[self.starts[y] : self.ends[y]]
+
+    def parsed_row(self, y: int) -> list:
+        row = self.rows.get(y)
+        if row is None:
+            row = self.parse_row(self.row(y), y)
+            if len(row) != self.width:
+                raise ValueError("Grid rows must all be the same length")
+            self.rows[y] = row
+        return row
+
+    def get(self, i: int):
+        y, x = divmod(i, self.width)
+        return self.parsed_row(y)[x]
+
+    def set(self, i: int, value):
+        raise TypeError("Memory-mapped cells are read-only")
+
+    def values(self) -> list:
+        return list(self)
+
+    def __iter__(self):
+        for y in range(len(self.starts)):
+            yield from self.parsed_row(y)
+
+    def copy(self) -> "_MappedCells":
+        # Nothing can write to the mapping, so copies can share it.
+        cells = type(self)(self.buf, self.starts, self.ends, self.width, self.parse_row)
+        cells.rows = self.rows
+        return cells
+
+    def widen(self) -> _ObjectCells:
+        return _pack(self.values())
+
+
+class _MappedByteCells(_MappedCells):
+    """
+    Memory-mapped cells for plain character grids, read straight out of the
+    mapping a byte at a time.
+    """
+
+    __slots__ = ()
+
+    bytewise = True
+
+    def get(self, i: int) -> str:
+        y, x = divmod(i, self.width)
+        return chr(self.buf[self.starts[y] + x])
+
+    def __iter__(self):
+        for y in range(len(self.starts)):
+            yield from map(chr, self.row(y))
+
+    def present(self) -> Iterable[int]:
+        present = set()
+        for y in range(len(self.starts)):
+            present.update(self.buf[self.starts[y] : self.ends[y]])
+        return present
+
+    def translate(self, table: bytes) -> bytes:
+        return b"".join(
+            self.buf[self.starts[y] : self.ends[y]].translate(table)
+            for y in range(len(self.starts))
+        )
+
+
+def _pack(values: list) -> _ObjectCells:
+    """
+    Picks the most compact storage that can hold every value. Single
+    characters become a bytearray, machine-sized ints an int64 array, and
+    anything else stays a plain list.
+    """
+    if len(values) > 0 and type(values[0]) is str:
+        try:
+            joined = "".join(values)
+            if len(joined) == len(values):
+                return _ByteCells(bytearray(joined.encode("latin-1")))
+        except (TypeError, UnicodeEncodeError):
+            pass
+    elif len(values) > 0 and all(type(v) is int for v in values):
+        try:
+            return _IntCells(array("q", values))
+        except OverflowError:
+            pass
+    return _ObjectCells(list(values))
+
+
+@lru_cache(maxsize=None)
+def _neighbor_offsets(
+    horizontal: bool = True, vertical: bool = True, diagonal: bool = False
+) -> Tuple[Tuple[int, int], ...]:
+    """
+    Neighbor offsets, in the order GridItem.neighbors lists them.
+    """
+    offsets = []
+    if vertical:
+        offsets.append((0, -1))
+    if horizontal:
+        offsets += [(-1, 0), (1, 0)]
+    if vertical:
+        offsets.append((0, 1))
+    if diagonal:
+        offsets += [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+    return tuple(offsets)
+
+
+class _NeighborTable:
+    """
+    The in-bounds neighbors of the cells of a grid shape, in the order of the
+    offsets.
+
+    A cell's neighbors only depend on which edges of the grid it touches, so
+    the table holds the neighbor offsets and matching id deltas of each kind
+    of cell, all worked out up front. `kind` picks the kind of a position,
+    and calling the table with a cell id gives the ids of its neighbors.
+    """
+
+    __slots__ = (
+        "width",
+        "height",
+        "last_x",
+        "last_y",
+        "offsets",
+        "deltas",
+        "inner_offsets",
+        "inner_deltas",
+    )
+
+    def __init__(self, width: int, height: int, offsets: Tuple[Tuple[int, int], ...]):
+        self.width = width
+        self.height = height
+        self.last_x = width - 1
+        self.last_y = height - 1
+        # A kind is a bit set of the edges a cell is on: 1 left, 2 right, 4 top
+        # and 8 bottom. Kind 0 is every cell away from the edges.
+        self.offsets: List[Tuple[Tuple[int, int], ...]] = []
+        self.deltas: List[Tuple[int, ...]] = []
+        for kind in range(16):
+            kept = tuple(
+                (dx, dy)
+                for dx, dy in offsets
+                if not (
+                    (dx < 0 and kind & 1)
+                    or (dx > 0 and kind & 2)
+                    or (dy < 0 and kind & 4)
+                    or (dy > 0 and kind & 8)
+                )
+            )
+            self.offsets.append(kept)
+            self.deltas.append(tuple(dy * width + dx for dx, dy in kept))
+        self.inner_offsets = self.offsets[0]
+        self.inner_deltas = self.deltas[0]
+
+    def kind(self, x: int, y: int) -> int:
+        if 0 < x < self.last_x and 0 < y < self.last_y:
+            return 0
+        return (
+            (x == 0)
+            | ((x == self.last_x) << 1)
+            | ((y == 0) << 2)
+            | ((y == self.last_y) << 3)
+        )
+
+    def __call__(self, i: int) -> List[int]:
+        y, x = divmod(i, self.width)
+        if 0 < x < self.last_x and 0 < y < self.last_y:
+            return [i + d for d in self.inner_deltas]
+        return [i + d for d in self.deltas[self.kind(x, y)]]
+
+
+@lru_cache(maxsize=16)
+def _neighbor_table(
+    width: int, height: int, offsets: Tuple[Tuple[int, int], ...]
+) -> _NeighborTable:
+    """
+    The neighbor table for a grid shape and offsets, cached per shape.
+    """
+    return _NeighborTable(width, height, offsets)
+
+
+def _count_neighbors(
+    mask: bytearray, width: int, height: int, offsets: List[Tuple[int, int]]
+) -> bytearray:
+    """
+    Sums a 0/1 mask over the given neighbor offsets for every cell at once.
+    """
+    if width == 0 or height == 0:
+        return bytearray()
+    if _np is not None:
+        padded = _np.zeros((height + 2, width + 2), dtype=_np.uint8)
+        padded[1:-1, 1:-1] = _np.frombuffer(mask, dtype=_np.uint8).reshape(
+            height, width
+        )
+        counts = _np.zeros((height, width), dtype=_np.uint8)
+        for dx, dy in offsets:
+            counts += padded[1 + dy : 1 + dy + height, 1 + dx : 1 + dx + width]
+        return bytearray(counts.tobytes())
+
+    # Without numpy, treat the mask as one big integer with a byte per cell and
+    # add shifted copies of it. Each row gets a zero separator byte so that
+    # horizontal shifts don't wrap into the next row, and since there are at
+    # most 8 neighbors no byte ever carries into the next one.
+    stride = width + 1
+    length = stride * height
+    rows = [mask[y * width : (y + 1) * width] for y in range(height)]
+    packed = int.from_bytes(b"\0".join(rows) + b"\0", "big")
+    total = 0
+    for dx, dy in offsets:
+        shift = (dy * stride + dx) * 8
+        total += packed << shift if shift > 0 else packed >> -shift
+    counts = (total & ((1 << (8 * length)) - 1)).to_bytes(length, "big")
+    return bytearray(
+        b"".join(counts[y * stride : y * stride + width] for y in range(height))
+    )
+
+
+def _step_rows(
+    src, dst, width: int, y0: int, y1: int, rule, table, bytewise
+) -> Optional[int]:
+    """
+    Applies a cellular automaton rule to rows y0 to y1 of a flat row-major
+    buffer, writing into another. Returns how many cells changed, or None if
+    the buffers are bytewise and the rule returned something that isn't a
+    single byte-sized character.
+    """
+    changed = 0
+    for i in range(y0 * width, y1 * width):
+        if bytewise:
+            value = chr(src[i])
+            neighbors = [chr(src[j]) for j in table(i)]
+        else:
+            value = src[i]
+            neighbors = [src[j] for j in table(i)]
+        new = rule(value, neighbors)
+        if new != value:
+            changed += 1
+        if bytewise:
+            try:
+                dst[i] = ord(new)
+            except (TypeError, ValueError):
+                return None
+        else:
+            dst[i] = new
+    return changed
+
+
+# Per-process state for parallel Grid.step workers.
+_band_state = {}
+
+
+def _band_init(blocks, width, height, rule, offsets):
+    _band_state["buffers"] = [block.buf for block in blocks]
+    _band_state["blocks"] = blocks
+    _band_state["args"] = (width, rule, _neighbor_table(width, height, offsets))
+
+
+def _band_step(y0: int, y1: int, step: int) -> int:
+    buffers = _band_state["buffers"]
+    width, rule, table = _band_state["args"]
+    src, dst = buffers[step % 2], buffers[(step + 1) % 2]
+    return _step_rows(src, dst, width, y0, y1, rule, table, True)
+
+
+# The most raycast tables cached per grid, and the most cells all of them
+# can cover together.
+_RAYCAST_CACHE_SIZE = 16
+_RAYCAST_CACHE_CELLS = 1 << 23
+
+# The most distance fields cached per grid, and the most cells all of them
+# can cover together.
+_FIELD_CACHE_SIZE = 8
+_FIELD_CACHE_CELLS = 1 << 22
+
+# Grids with up to this many cells keep an item for every cell once it has
+# been accessed. Bigger grids keep at most this many recently used items.
+_ITEM_POOL_SIZE = 1 << 18
+
+
+def _lru_put(cache: OrderedDict, key, value, limit: int):
+    """
+    Adds an entry to an LRU cache, dropping the least recently used entries
+    past the limit. Nothing is kept if the limit is 0.
+    """
+    if limit <= 0:
+        return
+    cache[key] = value
+    while len(cache) > limit:
+        cache.popitem(last=False)
+
+
+def _default_item_parser(c, x, y):
+    return c
+
+
+def _default_line_splitter(line):
+    return list(line)
+
+
 class Grid(Generic[A]):
     class GridItem(Generic[A]):
-        def __init__(self, parent: "Grid[A]", data: A, x: int, y: int):
+        """
+        A view of a single cell. Items are created on access and read their
+        data from the parent grid, so writes to either are visible in both.
+
+        Items hash by their cell id (`y * width + x`) and sort in row-major
+        order.
+        """
+
+        # _data is only used by pooled items, see _PooledItem.
+        __slots__ = ("parent", "x", "y", "id", "_data")
+
+        def __init__(self, parent: "Grid[A]", x: int, y: int):
             self.parent = parent
-            self.data = data
             self.x = x
             self.y = y
+            self.id = y * parent._width + x
+
+        @property
+        def data(self) -> A:
+            return self.parent._cell(self.id)
+
+        @data.setter
+        def data(self, value: A):
+            self.parent[self.x, self.y] = value
 
         def __repr__(self):
             return f"GridItem({repr(self.data)}, {self.x}, {self.y})"
@@ -34,24 +504,19 @@ class Grid(Generic[A]):
         def __eq__(self, other):
             return (
                 isinstance(other, Grid.GridItem)
-                and self.parent == other.parent
-                and self.data == other.data
-                and self.x == other.x
-                and self.y == other.y
+                and self.id == other.id
+                and self.parent is other.parent
             )
 
         def __lt__(self, other):
-            return (self.x + (self.y * self.parent.size()[1])) < (
-                other.x + (other.y * other.parent.size()[1])
-            )
+            return (self.y, self.x) < (other.y, other.x)
 
         def __hash__(self):
-            return hash((self.data, self.x, self.y))
+            return self.id
 
-        def clone(self, parent=None, item=None, x=None, y=None):
+        def clone(self, parent=None, x=None, y=None):
             return Grid.GridItem(
                 parent if parent is not None else self.parent,
-                item if item is not None else self.data,
                 x if x is not None else self.x,
                 y if y is not None else self.y,
             )
@@ -66,32 +531,23 @@ class Grid(Generic[A]):
             """
             Get a list of valid neighbor coordinates
             """
+            x, y = self.x, self.y
+            if not bounds:
+                return [
+                    (x + dx, y + dy)
+                    for dx, dy in _neighbor_offsets(horizontal, vertical, diagonal)
+                ]
+            try:
+                table = self.parent._tables[horizontal, vertical, diagonal]
+            except KeyError:
+                table = self.parent._neighbor_table(horizontal, vertical, diagonal)
+            if 0 < x < table.last_x and 0 < y < table.last_y:
+                offsets = table.inner_offsets
+            else:
+                offsets = table.offsets[table.kind(x, y)]
             res = []
-            sx, sy = self.parent.size()
-
-            if vertical:
-                if not bounds or self.y - 1 >= 0:
-                    res.append((self.x, self.y - 1))
-
-            if horizontal:
-                if not bounds or self.y < sy and self.x - 1 >= 0:
-                    res.append((self.x - 1, self.y))
-                if not bounds or self.y < sy and self.x + 1 < sx:
-                    res.append((self.x + 1, self.y))
-
-            if vertical:
-                if not bounds or self.y + 1 < sy and self.x < sx:
-                    res.append((self.x, self.y + 1))
-
-            if diagonal:
-                if not bounds or self.y + 1 < sy and self.x + 1 < sx:
-                    res.append((self.x + 1, self.y + 1))
-                if not bounds or self.y + 1 < sy and self.x - 1 >= 0:
-                    res.append((self.x - 1, self.y + 1))
-                if not bounds or self.y - 1 >= 0 and self.x + 1 < sx:
-                    res.append((self.x + 1, self.y - 1))
-                if not bounds or self.y - 1 >= 0 and self.x - 1 >= 0:
-                    res.append((self.x - 1, self.y - 1))
+            for dx, dy in offsets:
+                res.append((x + dx, y + dy))
             return res
 
         def neighbors(
@@ -104,33 +560,25 @@ class Grid(Generic[A]):
             """
             Get a list of valid neighbor coordinates
             """
-            res = []
-            sx, sy = self.parent.size()
-
-            if vertical:
-                if not bounds or self.y - 1 >= 0:
-                    res.append(self.parent[self.x, self.y - 1])
-
-            if horizontal:
-                if not bounds or self.y < sy and self.x - 1 >= 0:
-                    res.append(self.parent[self.x - 1, self.y])
-                if not bounds or self.y < sy and self.x + 1 < sx:
-                    res.append(self.parent[self.x + 1, self.y])
-
-            if vertical:
-                if not bounds or self.y + 1 < sy and self.x < sx:
-                    res.append(self.parent[self.x, self.y + 1])
-
-            if diagonal:
-                if not bounds or self.y + 1 < sy and self.x + 1 < sx:
-                    res.append(self.parent[self.x + 1, self.y + 1])
-                if not bounds or self.y + 1 < sy and self.x - 1 >= 0:
-                    res.append(self.parent[self.x - 1, self.y + 1])
-                if not bounds or self.y - 1 >= 0 and self.x + 1 < sx:
-                    res.append(self.parent[self.x + 1, self.y - 1])
-                if not bounds or self.y - 1 >= 0 and self.x - 1 >= 0:
-                    res.append(self.parent[self.x - 1, self.y - 1])
-            return res
+            parent = self.parent
+            if not bounds:
+                return [
+                    parent[self.x + dx, self.y + dy]
+                    for dx, dy in _neighbor_offsets(horizontal, vertical, diagonal)
+                ]
+            try:
+                table = parent._tables[horizontal, vertical, diagonal]
+            except KeyError:
+                table = parent._neighbor_table(horizontal, vertical, diagonal)
+            x, y, i = self.x, self.y, self.id
+            if 0 < x < table.last_x and 0 < y < table.last_y:
+                deltas = table.inner_deltas
+            else:
+                deltas = table.deltas[table.kind(x, y)]
+            ids = []
+            for d in deltas:
+                ids.append(i + d)
+            return parent._items(ids)
 
         def neighbor_data(
             self,
@@ -288,6 +736,29 @@ class Grid(Generic[A]):
                 y += direction[1]
             return None
 
+        def raycast_data(
+            self, direction: Tuple[int, int], match: Union[A, Callable[[A], bool]]
+        ) -> "Grid.GridItem[A]":
+            """
+            Finds the first item in a direction whose data matches a value or
+            data predicate, or None if the ray leaves the grid.
+
+            Uses a jump table cached on the grid, so repeated casts with the
+            same direction and match (pass the same function object, not a new
+            lambda each call) are a single lookup.
+
+            Example:
+            ```
+            item.raycast_data((0, 1), "^")
+            ```
+            """
+            width = self.parent.size()[0]
+            table = self.parent.raycast_table(direction, match)
+            i = table[self.y * width + self.x]
+            if i == -1:
+                return None
+            return self.parent._item(i)
+
         def __add__(self, other: Tuple[int, int]) -> "Grid.GridItem[A]":
             return self.parent[self.x + other[0], self.y + other[1]]
 
@@ -302,191 +773,1162 @@ class Grid(Generic[A]):
             return self.data
 
     def __init__(self, data: List[List[A]]):
-        self.__data = []
-        for y, row in enumerate(data):
-            self.__data.append([])
-            for x, item in enumerate(row):
-                self.__data[-1].append(Grid.GridItem(self, item, x, y))
+        height = len(data)
+        width = len(data[0]) if height > 0 else 0
+        values = []
+        for row in data:
+            if len(row) != width:
+                raise ValueError("Grid rows must all be the same length")
+            values.extend(row)
+        self.__width = width
+        self.__height = height
+        self.__cells = _pack(values)
+        self.__raycasts = OrderedDict()
+        self.__fields = OrderedDict()
+        self.__pool = Grid._new_pool(width * height)
+        self.__pool_full = False
+        # Neighbor tables by (horizontal, vertical, diagonal).
+        self._tables = {}
+
+    @staticmethod
+    def _from_cells(cells: _ObjectCells, width: int, height: int) -> "Grid[A]":
+        grid = Grid([])
+        grid.__width = width
+        grid.__height = height
+        grid.__cells = cells
+        grid.__pool = Grid._new_pool(width * height)
+        grid.__pool_full = False
+        grid._tables = {}
+        return grid
+
+    @staticmethod
+    def _new_pool(size: int) -> Union[list, dict]:
+        """
+        The pool of items handed out so far, by cell id. Small grids get a
+        slot per cell, bigger ones a dict that is emptied when it fills up.
+        """
+        return [None] * size if size <= _ITEM_POOL_SIZE else {}
+
+    def _pooled(self) -> Callable[[int], Optional[GridItem[A]]]:
+        """
+        A lookup from cell id to pooled item, or None if there isn't one.
+        """
+        pool = self.__pool
+        return pool.__getitem__ if isinstance(pool, list) else pool.get
 
     @staticmethod
     def parse(
         raw: List[Iterable[A]],
-        item_parser: Callable[[A, int, int], B] = lambda c, x, y: c,
+        item_parser: Callable[[A, int, int], B] = _default_item_parser,
+        index: bool = False,
     ) -> "Grid[B]":
         """
         Parses a list of lists into a grid using the given item parser.
+
+        If index is True, also builds the value index used by `find`.
         """
         data = []
         for y, row in enumerate(raw):
             data.append([])
             for x, item in enumerate(row):
                 data[-1].append(item_parser(item, x, y))
-        return Grid(data)
+        grid = Grid(data)
+        if index:
+            grid._value_index()
+        return grid
 
     @staticmethod
     def read(
         filename: str,
-        item_parser: Callable[[A, int, int], B] = lambda c, x, y: c,
-        line_splitter: Callable[[List[str]], List[A]] = lambda line: list(line),
+        item_parser: Callable[[A, int, int], B] = _default_item_parser,
+        line_splitter: Callable[[List[str]], List[A]] = _default_line_splitter,
+        lazy: bool = False,
+        index: bool = False,
     ) -> "Grid[B]":
         """
         Parses a text file into a grid using the given item parser. Defaults to
         splitting lines character-wise.
+
+        If lazy is True, the file is memory-mapped instead of read, and rows
+        are only decoded when a cell in them is first accessed. The grid is
+        read-only until the first write, which loads the whole grid.
+
+        If index is True, also builds the value index used by `find`.
         """
+        if lazy:
+            grid = Grid._read_mapped(filename, item_parser, line_splitter)
+        else:
+            grid = Grid._read_eager(filename, item_parser, line_splitter)
+        if index:
+            grid._value_index()
+        return grid
+
+    @staticmethod
+    def _read_eager(
+        filename: str,
+        item_parser: Callable[[A, int, int], B],
+        line_splitter: Callable[[List[str]], List[A]],
+    ) -> "Grid[B]":
         with open(filename) as f:
             inp = list(map(str.strip, f.readlines()))
-            data = []
-            for y, line in enumerate(map(line_splitter, inp)):
-                data.append([])
-                for x, item in enumerate(line):
-                    data[-1].append(item_parser(item, x, y))
-            return Grid(data)
+        # Files often end with a blank line, which isn't a row.
+        while len(inp) > 0 and inp[-1] == "":
+            inp.pop()
+        if (
+            item_parser is _default_item_parser
+            and line_splitter is _default_line_splitter
+            and len(inp) > 0
+            and all(len(line) == len(inp[0]) for line in inp)
+        ):
+            # Plain character grids skip the per-cell parse entirely.
+            values = "".join(inp)
+            try:
+                cells = _ByteCells(bytearray(values.encode("latin-1")))
+            except UnicodeEncodeError:
+                cells = _ObjectCells(list(values))
+            return Grid._from_cells(cells, len(inp[0]), len(inp))
+        data = []
+        for y, line in enumerate(map(line_splitter, inp)):
+            data.append([])
+            for x, item in enumerate(line):
+                data[-1].append(item_parser(item, x, y))
+        return Grid(data)
+
+    @staticmethod
+    def _read_mapped(
+        filename: str,
+        item_parser: Callable[[A, int, int], B],
+        line_splitter: Callable[[List[str]], List[A]],
+    ) -> "Grid[B]":
+        with open(filename, "rb") as f:
+            if f.seek(0, 2) == 0:
+                return Grid([])
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Index the start and end of each line, trimming whitespace the same
+        # way str.strip does for the eager reader.
+        whitespace = b" \t\r\n\x0b\x0c"
+        starts, ends = array("q"), array("q")
+        start = 0
+        while start < len(buf):
+            end = buf.find(b"\n", start)
+            next_start = len(buf) if end == -1 else end + 1
+            end = len(buf) if end == -1 else end
+            line_start, line_end = start, end
+            while line_start < line_end and buf[line_start] in whitespace:
+                line_start += 1
+            while line_end > line_start and buf[line_end - 1] in whitespace:
+                line_end -= 1
+            starts.append(line_start)
+            ends.append(line_end)
+            start = next_start
+        # Files often end with a blank line, which isn't a row.
+        while len(starts) > 0 and starts[-1] == ends[-1]:
+            starts.pop()
+            ends.pop()
+        height = len(starts)
+        if height == 0:
+            return Grid([])
+
+        if (
+            item_parser is _default_item_parser
+            and line_splitter is _default_line_splitter
+            and re.search(rb"[\x80-\xff]", buf) is None
+        ):
+            width = ends[0] - starts[0]
+            for y in range(height):
+                if ends[y] - starts[y] != width:
+                    raise ValueError("Grid rows must all be the same length")
+            cells = _MappedByteCells(buf, starts, ends, width)
+        else:
+
+            def parse_row(raw: memoryview, y: int) -> list:
+                line = line_splitter(str(raw, "utf-8"))
+                return [item_parser(item, x, y) for x, item in enumerate(line)]
+
+            first = parse_row(memoryview(buf)[starts[0] : ends[0]], 0)
+            cells = _MappedCells(buf, starts, ends, len(first), parse_row)
+            cells.rows[0] = first
+        return Grid._from_cells(cells, cells.width, height)
+
+    def _value_index(self) -> Dict[A, Set[int]]:
+        """
+        Returns the index of cell ids by value, building it on first use.
+        """
+        cells = self.__cells
+        if cells.index is None:
+            index = {}
+            if isinstance(cells, _ByteCells) and _np is not None:
+                values = cells.numpy()
+                for b in cells.present():
+                    index[chr(b)] = set(_np.flatnonzero(values == b).tolist())
+            else:
+                for i, value in enumerate(cells):
+                    if value in index:
+                        index[value].add(i)
+                    else:
+                        index[value] = {i}
+            cells.index = index
+        return cells.index
+
+    def find(self, value: A) -> Optional[GridItem[A]]:
+        """
+        Finds the first item (in row-major order) holding a value, or None.
+
+        This and the other value lookups use an index of cells by value that
+        is built on first use (or by `read`/`parse` with index=True) and kept
+        up to date as the grid is written to.
+        """
+        ids = self._value_index().get(value)
+        if not ids:
+            return None
+        i = min(ids)
+        return self[i % self.__width, i // self.__width]
+
+    def find_all(self, value: A) -> List[GridItem[A]]:
+        """
+        Finds every item holding a value, in row-major order.
+        """
+        width = self.__width
+        ids = sorted(self._value_index().get(value, ()))
+        return [self[i % width, i // width] for i in ids]
+
+    def count(self, value: A) -> int:
+        """
+        Counts the items holding a value.
+        """
+        return len(self._value_index().get(value, ()))
+
+    def items(self) -> Iterable[GridItem[A]]:
+        """
+        Iterates over every item in the grid in row-major order.
+        """
+        pool = self.__pool
+        if isinstance(pool, list):
+            self._fill_pool()
+            yield from pool
+            return
+        for i in range(len(self)):
+            yield pool.get(i) or self._item(i)
 
     def filter(self, filter: Callable[[GridItem[A]], bool]) -> List[GridItem[A]]:
         """
         Finds coordinates where a given filter returns true in a grid.
         """
-        results = []
-        for row in self.__data:
-            for item in row:
-                if filter(item):
-                    results.append(item)
-        return results
-
-    def map(self, map: Callable[[GridItem[A]], B]) -> "Grid[B]":
+        pool = self.__pool
+        if isinstance(pool, list):
+            self._fill_pool()
+            return [item for item in pool if filter(item)]
+        return [item for item in self.items() if filter(item)]
+
+    def map(
+        self, map: Callable[[GridItem[A]], B], in_place: bool = False
+    ) -> "Grid[B]":
         """
         Transforms each item in a grid to something else.
+
+        If in_place is True, every new value is computed from the grid as it
+        was before the map, then only the cells whose value changed are
+        written back. Returns the same grid.
         """
-        data = []
-        grid = Grid(data)
-        for y, row in enumerate(self.__data):
-            data.append([])
-            for x, item in enumerate(row):
-                data[-1].append(Grid.GridItem(grid, map(item), x, y))
-        grid.__data = data
-        return grid
+        if in_place:
+            changes = []
+            for item in self.items():
+                value = map(item)
+                if value != item.data:
+                    changes.append((item.id, value))
+            self._write(changes)
+            return self
+        return Grid._from_cells(
+            _pack([map(item) for item in self.items()]), self.__width, self.__height
+        )
+
+    def update(self, changes: Union[Dict[Coord, A], Iterable[Tuple[Coord, A]]]):
+        """
+        Sets the data of many cells at once, from a dict or from pairs of
+        ((x, y), value).
+        """
+        width, height = self.__width, self.__height
+        ids = []
+        for (x, y), value in changes.items() if isinstance(changes, dict) else changes:
+            if y < 0 or y >= height or x < 0 or x >= width:
+                raise IndexError(f"{(x, y)} is outside of the grid")
+            ids.append((y * width + x, value))
+        self._write(ids)
+
+    def filter_mask(self, match: Union[A, Callable[[A], bool]]) -> bytearray:
+        """
+        Evaluates a value or a data predicate against every cell, returning a
+        flat row-major mask with a 1 for each match. Index it with
+        `y * width + x`.
+
+        On character grids the predicate runs once per distinct character
+        rather than once per cell.
+
+        Examples:
+        ```
+        grid.filter_mask("@")
+        grid.filter_mask(str.isnumeric)
+        ```
+        """
+        test = match if callable(match) else lambda v: v == match
+        cells = self.__cells
+        if cells.bytewise:
+            table = bytearray(256)
+            for b in cells.present():
+                table[b] = 1 if test(chr(b)) else 0
+            return bytearray(cells.translate(table))
+        if isinstance(cells, _IntCells) and _np is not None and not callable(match):
+            return bytearray((cells.numpy() == match).astype(_np.uint8).tobytes())
+        return bytearray(1 if test(value) else 0 for value in cells)
+
+    def neighbor_counts(
+        self,
+        match: Union[A, Callable[[A], bool]],
+        horizontal: bool = True,
+        vertical: bool = True,
+        diagonal: bool = False,
+    ) -> bytearray:
+        """
+        Counts the neighbors matching a value or data predicate for every cell
+        in one pass, returning a flat row-major array of counts. This is the
+        batched form of `GridItem.count_neighbor_data`.
+
+        Example:
+        ```
+        counts = grid.neighbor_counts("@", diagonal=True)
+        counts[y * width + x]
+        ```
+        """
+        return _count_neighbors(
+            self.filter_mask(match),
+            self.__width,
+            self.__height,
+            _neighbor_offsets(horizontal, vertical, diagonal),
+        )
+
+    def step(
+        self,
+        rule: Callable[[A, List[A]], A],
+        steps: int = 1,
+        until_stable: bool = False,
+        horizontal: bool = True,
+        vertical: bool = True,
+        diagonal: bool = False,
+        workers: int = 1,
+    ) -> int:
+        """
+        Runs a cellular automaton over the grid in place. Each step, every
+        cell is replaced with `rule(data, neighbor_data)`, with all cells
+        reading the previous step. Runs the given number of steps, or if
+        until_stable is True, until a step changes nothing (steps then only
+        caps the count, and may be None). Returns the number of steps run.
+
+        Character grids are stepped one byte per cell. If the rule returns
+        anything else, the serial path moves the grid to general storage and
+        carries on from there.
+
+        With more than one worker, character grids are split into horizontal
+        bands that run in a process pool. Both generations live in shared
+        memory, so each band reads its neighbors' edge rows directly and
+        nothing but row ranges is pickled. Here the rule has to return single
+        characters (a TypeError is raised otherwise), and has to be picklable
+        if processes aren't forked.
+
+        Example:
+        ```
+        grid.step(
+            lambda v, ns: "." if v == "@" and ns.count("@") < 4 else v,
+            until_stable=True,
+            diagonal=True,
+        )
+        ```
+        """
+        width, height = self.__width, self.__height
+        offsets = _neighbor_offsets(horizontal, vertical, diagonal)
+        run = 0
+
+        def more():
+            return steps is None or run < steps
+
+        if workers <= 1 or not isinstance(self.__cells, _ByteCells) or height < 2:
+            cells = self.__cells
+            bytewise = isinstance(cells, _ByteCells)
+            table = _neighbor_table(width, height, offsets)
+            buffers = [
+                bytearray(cells.buf) if bytewise else cells.values(),
+                bytearray(len(self)) if bytewise else [None] * len(self),
+            ]
+            while more():
+                src, dst = buffers[run % 2], buffers[(run + 1) % 2]
+                changed = _step_rows(src, dst, width, 0, height, rule, table, bytewise)
+                if changed is None:
+                    # The rule returned something that doesn't fit in a byte,
+                    # so redo the step on plain lists.
+                    bytewise = False
+                    buffers[run % 2] = list(src.decode("latin-1"))
+                    buffers[(run + 1) % 2] = [None] * len(self)
+                    continue
+                run += 1
+                if until_stable and changed == 0:
+                    break
+            result = buffers[run % 2]
+            self._replace(_ByteCells(result) if bytewise else _pack(result))
+            return run
+
+        n = len(self)
+        workers = min(workers, height)
+        bands = [
+            (height * k // workers, height * (k + 1) // workers) for k in range(workers)
+        ]
+        blocks = [shared_memory.SharedMemory(create=True, size=n) for _ in range(2)]
+        try:
+            blocks[0].buf[:n] = self.__cells.buf
+            with ProcessPoolExecutor(
+                workers,
+                initializer=_band_init,
+                initargs=(blocks, width, height, rule, offsets),
+            ) as pool:
+                while more():
+                    futures = [pool.submit(_band_step, y0, y1, run) for y0, y1 in bands]
+                    counts = [future.result() for future in futures]
+                    if None in counts:
+                        raise TypeError(
+                            "Parallel steps need rules that return single characters"
+                        )
+                    changed = sum(counts)
+                    run += 1
+                    if until_stable and changed == 0:
+                        break
+            self._replace(_ByteCells(bytearray(blocks[run % 2].buf[:n])))
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+        return run
+
+    def raycast_table(
+        self, direction: Tuple[int, int], match: Union[A, Callable[[A], bool]]
+    ) -> array:
+        """
+        Builds a flat row-major table giving, for every cell, the id
+        (`y * width + x`) of the first cell after it in a direction whose data
+        matches a value or data predicate, or -1 if there isn't one.
+
+        Tables are kept in a small LRU cache keyed by direction and match until
+        the grid is modified. Like distance fields, the cache is also bounded
+        by the total number of cells.
+        """
+        key = (direction, match)
+        if key in self.__raycasts:
+            self.__raycasts.move_to_end(key)
+            return self.__raycasts[key]
+        dx, dy = direction
+        if dx == 0 and dy == 0:
+            raise ValueError("Raycast direction can't be (0, 0)")
+        width, height = self.__width, self.__height
+        mask = self.filter_mask(match)
+        table = array("i", [-1]) * len(self)
+        # Visit cells so that the next cell along the ray is always done first.
+        ys = range(height - 1, -1, -1) if dy > 0 else range(height)
+        xs = range(width - 1, -1, -1) if dx > 0 else range(width)
+        for y in ys:
+            ny = y + dy
+            if ny < 0 or ny >= height:
+                continue
+            for x in xs:
+                nx = x + dx
+                if 0 <= nx < width:
+                    j = ny * width + nx
+                    table[y * width + x] = j if mask[j] else table[j]
+        limit = min(_RAYCAST_CACHE_SIZE, _RAYCAST_CACHE_CELLS // max(len(self), 1))
+        _lru_put(self.__raycasts, key, table, limit)
+        return table
+
+    def erode(
+        self,
+        match: Union[A, Callable[[A], bool]],
+        rule: Callable[[int], bool],
+        replacement: A,
+        horizontal: bool = True,
+        vertical: bool = True,
+        diagonal: bool = False,
+        history: bool = False,
+    ) -> Union[int, Tuple[int, List[List[Coord]]]]:
+        """
+        Repeatedly replaces matching cells whose count of matching neighbors
+        satisfies `rule` until nothing changes, returning the number of cells
+        removed. Each round is decided against the grid as it was at the start
+        of that round. Modifies the grid in place.
+
+        Neighbor counts are kept up to date as cells are removed, so only the
+        neighbors of removed cells are re-checked after the first round.
+
+        If history is True, also returns the positions removed in each round.
+
+        Example:
+        ```
+        grid.erode("@", lambda count: count < 4, ".", diagonal=True)
+        ```
+        """
+        width, height = self.__width, self.__height
+        offsets = _neighbor_offsets(horizontal, vertical, diagonal)
+        alive = self.filter_mask(match)
+        counts = _count_neighbors(alive, width, height, offsets)
+        removable = bytes(1 if rule(c) else 0 for c in range(len(offsets) + 1))
+        ready = counts.translate(removable.ljust(256, b"\0"))
+
+        frontier = []
+        i = ready.find(1)
+        while i != -1:
+            if alive[i]:
+                frontier.append(i)
+            i = ready.find(1, i + 1)
+
+        neighbor_ids = _neighbor_table(width, height, offsets)
+        total = 0
+        rounds = []
+        while len(frontier) > 0:
+            for i in frontier:
+                alive[i] = 0
+            self._write([(i, replacement) for i in frontier])
+            touched = {}
+            for i in frontier:
+                for j in neighbor_ids(i):
+                    counts[j] -= 1
+                    if alive[j]:
+                        touched[j] = None
+            total += len(frontier)
+            if history:
+                rounds.append([(i % width, i // width) for i in frontier])
+            frontier = [j for j in touched if alive[j] and removable[counts[j]]]
+        if history:
+            return total, rounds
+        return total
+
+    def _scanline(
+        self,
+        x: int,
+        y: int,
+        inside: Callable[[int], bool],
+        visited: bytearray,
+        diagonal: bool = False,
+    ) -> Iterable[Tuple[int, int, int]]:
+        """
+        Scanline fill from a position, yielding each filled horizontal span as
+        (y, first x, last x). `inside` tests a cell id, and cells are marked in
+        `visited` as they are filled.
+        """
+        width, height = self.__width, self.__height
+        reach = 1 if diagonal else 0
+        stack = [(x, y)]
+        while len(stack) > 0:
+            x, y = stack.pop()
+            row = y * width
+            if visited[row + x] or not inside(row + x):
+                continue
+            lx = x
+            while lx > 0 and not visited[row + lx - 1] and inside(row + lx - 1):
+                lx -= 1
+            rx = x
+            while (
+                rx + 1 < width and not visited[row + rx + 1] and inside(row + rx + 1)
+            ):
+                rx += 1
+            visited[row + lx : row + rx + 1] = b"\1" * (rx - lx + 1)
+            yield y, lx, rx
+            lo, hi = max(lx - reach, 0), min(rx + reach, width - 1)
+            for ny in (y - 1, y + 1):
+                if ny < 0 or ny >= height:
+                    continue
+                nrow = ny * width
+                # Queue one seed per run of fillable cells along the span.
+                in_run = False
+                for nx in range(lo, hi + 1):
+                    fillable = not visited[nrow + nx] and inside(nrow + nx)
+                    if fillable and not in_run:
+                        stack.append((nx, ny))
+                    in_run = fillable
 
     def flood(
         self,
         start: Union[Tuple[int, int], GridItem[A]],
         is_valid: Callable[[GridItem[A]], bool],
-        get_next: Callable[
-            [GridItem[A]], List[GridItem[A]]
-        ] = lambda item: item.neighbors(),
+        get_next: Optional[Callable[[GridItem[A]], List[GridItem[A]]]] = None,
     ) -> Tuple[int, Set[GridItem[A]]]:
         """
         Floods a grid starting at the given coordinates, returning the number of
         valid items and a set of valid items.
+
+        By default this floods orthogonal neighbors with a scanline fill. A
+        custom get_next falls back to a breadth first search over its results.
         """
-        count = 0
-        to_visit = [start if isinstance(start, tuple) else (start.x, start.y)]
-        valid = set()
-        visited = set()
+        x, y = start if isinstance(start, tuple) else (start.x, start.y)
+        if self[x, y] is None:
+            return 0, set()
+        valid = self._cell_filter(is_valid)
+        visited = bytearray(len(self))
+        items = set()
+        if get_next is None:
+            for y, lx, rx in self._scanline(x, y, valid, visited):
+                items.update(Grid.GridItem(self, x, y) for x in range(lx, rx + 1))
+            return len(items), items
+
+        width = self.__width
+        to_visit = deque([y * width + x])
+        visited[y * width + x] = 1
         while len(to_visit) > 0:
-            check = to_visit.pop(0)
-            visited.add(check)
-            item = self[check]
-            if is_valid(item):
-                count += 1
-                valid.add(item)
-                neighbors = get_next(item)
-                n = [
-                    neighbor.position()
-                    for neighbor in neighbors
-                    if neighbor.position() not in visited
-                ]
-                to_visit.extend(n)
-                visited.update(n)
-        return count, valid
+            i = to_visit.popleft()
+            if valid(i):
+                item = Grid.GridItem(self, i % width, i // width)
+                items.add(item)
+                for neighbor in get_next(item):
+                    j = neighbor.y * width + neighbor.x
+                    if not visited[j]:
+                        visited[j] = 1
+                        to_visit.append(j)
+        return len(items), items
+
+    def label_components(
+        self, match: Union[A, Callable[[A], bool]], diagonal: bool = False
+    ) -> Tuple[array, List[int], List[Tuple[int, int, int, int]]]:
+        """
+        Labels every connected region of cells matching a value or data
+        predicate in one pass over the grid.
+
+        Returns a flat row-major array of component ids (-1 for cells that
+        don't match), plus the size and bounding box (min x, min y, max x,
+        max y) of each component, indexed by id.
+
+        Example:
+        ```
+        labels, sizes, boxes = grid.label_components("#", diagonal=True)
+        labels[y * width + x]
+        ```
+        """
+        width = self.__width
+        mask = self.filter_mask(match)
+        labels = array("i", [-1]) * len(self)
+        visited = bytearray(len(self))
+        sizes = []
+        boxes = []
+        i = mask.find(1)
+        while i != -1:
+            if not visited[i]:
+                label = len(sizes)
+                size = 0
+                min_x, min_y, max_x, max_y = width, i // width, 0, 0
+                for y, lx, rx in self._scanline(
+                    i % width, i // width, mask.__getitem__, visited, diagonal
+                ):
+                    row, span = y * width, rx - lx + 1
+                    labels[row + lx : row + rx + 1] = array("i", [label]) * span
+                    size += span
+                    min_x, max_x = min(min_x, lx), max(max_x, rx)
+                    min_y, max_y = min(min_y, y), max(max_y, y)
+                sizes.append(size)
+                boxes.append((min_x, min_y, max_x, max_y))
+            i = mask.find(1, i + 1)
+        return labels, sizes, boxes
 
     def clone(self) -> "Grid[A]":
-        return Grid([[item.data for item in row] for row in self.__data])
+        """
+        Returns a copy of the grid. The copy shares storage with this grid
+        until either of them is written to.
+        """
+        self.__cells.shares += 1
+        return Grid._from_cells(self.__cells, self.__width, self.__height)
+
+    def _cell_filter(
+        self, filter: Callable[[GridItem[A]], bool]
+    ) -> Callable[[int], bool]:
+        """
+        Wraps an item filter in a lookup by cell id that only evaluates the
+        filter once per cell.
+        """
+        width = self.__width
+        known = bytearray(width * self.__height)
+
+        def lookup(i: int) -> bool:
+            if known[i] == 0:
+                y, x = divmod(i, width)
+                known[i] = 1 if filter(Grid.GridItem(self, x, y)) else 2
+            return known[i] == 1
+
+        return lookup
+
+    def _trace(self, parent: array, i: int) -> List[Coord]:
+        """
+        Follows parent pointers from a cell back to a cell that is its own
+        parent.
+        """
+        path = []
+        while parent[i] != i:
+            i = parent[i]
+            path.append((i % self.__width, i // self.__width))
+        path.reverse()
+        return path
 
     def shortest_path(
         self,
         start: Tuple[int, int],
         end: Tuple[int, int],
         is_obstacle: Callable[[GridItem[A]], bool] = lambda c: c.data == "#",
-    ) -> List[GridItem[A]]:
-        """ """
-        from collections import deque
+        mode: str = "bfs",
+        cost: Optional[Callable[[GridItem[A]], int]] = None,
+        cached: bool = False,
+    ) -> Optional[Tuple[int, List[Coord]]]:
+        """
+        Finds the shortest orthogonal path between two positions, returning the
+        length of the path and the positions visited before reaching the end.
+        Returns None if the end can't be reached.
+
+        Modes:
+        - "bfs": breadth first search (or Dijkstra when given a cost)
+        - "astar": A* with a Manhattan distance heuristic
+        - "bidirectional": breadth first search from both ends at once,
+          unweighted only
+
+        If cost is given, it is the cost of stepping onto an item, and the
+        returned length is the total cost. The A* heuristic assumes every step
+        costs at least 1.
+
+        A plain breadth first search stops as soon as it reaches the end. If
+        cached is True, it instead builds the whole distance field from the
+        start (see `distance_field`) and caches it, keyed by the start and the
+        is_obstacle function, so later queries from the same start only walk
+        the path back. A field cached that way is reused even without cached.
+        """
+        if mode not in ("bfs", "astar", "bidirectional"):
+            raise ValueError(f"Unknown shortest path mode {mode!r}")
+        width = self.__width
+        if self[start] is None or self[end] is None:
+            return None
+        s = start[1] * width + start[0]
+        t = end[1] * width + end[0]
+        passable = self._cell_filter(lambda item: not is_obstacle(item))
+        if mode == "bidirectional":
+            if cost is not None:
+                raise ValueError("Bidirectional search doesn't support costs")
+            return self._bidirectional_path(s, t, passable)
+        if mode == "bfs" and cost is None:
+            key = ("obstacle", is_obstacle)
+            if not cached and ((start,), key) not in self.__fields:
+                return self._bfs_path(s, t, passable)
+            dist, parent = self._distance_field((start,), key, passable)
+            if dist[t] == -1:
+                return None
+            return dist[t], self._trace(parent, t)
+        return self._weighted_path(s, t, passable, cost, mode == "astar")
+
+    def _neighbor_table(
+        self, horizontal: bool = True, vertical: bool = True, diagonal: bool = False
+    ) -> _NeighborTable:
+        """
+        The neighbor table for this grid's shape, see `_NeighborTable`.
+        """
+        key = (horizontal, vertical, diagonal)
+        table = self._tables.get(key)
+        if table is None:
+            offsets = _neighbor_offsets(horizontal, vertical, diagonal)
+            table = _neighbor_table(self.__width, self.__height, offsets)
+            self._tables[key] = table
+        return table
+
+    def distance_field(
+        self,
+        sources: Iterable[Coord],
+        passable: Callable[[GridItem[A]], bool] = lambda c: c.data != "#",
+    ) -> Tuple[array, array]:
+        """
+        Runs one breadth first search from every source at once over
+        orthogonal neighbors, returning flat row-major arrays of the distance
+        to the nearest source and the previous cell id on the way there
+        (sources are their own parent). Unreachable cells are -1 in both.
+
+        Fields are kept in a small LRU cache keyed by the sources and the
+        passable function (pass the same function object to reuse them) until
+        the grid is modified. The cache is also bounded by the total number of
+        cells, so fields of very large grids aren't kept at all. The returned
+        arrays are shared with the cache and shouldn't be modified.
+        """
+        return self._distance_field(
+            tuple(sources), passable, self._cell_filter(passable)
+        )
 
-        q = deque([(start, 0, [])])
-        visited = set()
+    def _distance_field(
+        self, sources: Tuple[Coord, ...], key, passable: Callable[[int], bool]
+    ) -> Tuple[array, array]:
+        cache_key = (sources, key)
+        if cache_key in self.__fields:
+            self.__fields.move_to_end(cache_key)
+            return self.__fields[cache_key]
+        width = self.__width
+        neighbor_ids = self._neighbor_table()
+        dist = array("i", [-1]) * len(self)
+        parent = array("i", [-1]) * len(self)
+        q = deque()
+        for x, y in sources:
+            if self[x, y] is None:
+                continue
+            s = y * width + x
+            if parent[s] == -1:
+                parent[s] = s
+                dist[s] = 0
+                q.append(s)
         while len(q) > 0:
-            (x, y), steps, history = q.popleft()
-            if (x, y) == end:
-                return steps, history
-            for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-                if (x + dx, y + dy) in visited:
-                    continue
-                next = self[x + dx, y + dy]
-                if next is None:
+            i = q.popleft()
+            for j in neighbor_ids(i):
+                if parent[j] == -1 and passable(j):
+                    parent[j] = i
+                    dist[j] = dist[i] + 1
+                    q.append(j)
+        limit = min(_FIELD_CACHE_SIZE, _FIELD_CACHE_CELLS // max(len(self), 1))
+        _lru_put(self.__fields, cache_key, (dist, parent), limit)
+        return dist, parent
+
+    def _bfs_path(
+        self, s: int, t: int, passable: Callable[[int], bool]
+    ) -> Optional[Tuple[int, List[Coord]]]:
+        neighbor_ids = self._neighbor_table()
+        parent = array("i", [-1]) * len(self)
+        parent[s] = s
+        q = deque([s])
+        while len(q) > 0:
+            i = q.popleft()
+            if i == t:
+                path = self._trace(parent, t)
+                return len(path), path
+            for j in neighbor_ids(i):
+                if parent[j] == -1 and passable(j):
+                    parent[j] = i
+                    q.append(j)
+        return None
+
+    def _weighted_path(
+        self,
+        s: int,
+        t: int,
+        passable: Callable[[int], bool],
+        cost: Optional[Callable[[GridItem[A]], int]],
+        astar: bool,
+    ) -> Optional[Tuple[int, List[Coord]]]:
+        from heapq import heappop, heappush
+
+        width = self.__width
+        neighbor_ids = self._neighbor_table()
+        tx, ty = t % width, t // width
+        parent = array("i", [-1]) * len(self)
+        dist = [None] * len(self)
+        parent[s] = s
+        dist[s] = 0
+        # Ties are broken towards the deepest item, which keeps A* from
+        # widening across open areas where many items share a score.
+        q = [(0, 0, s)]
+        while len(q) > 0:
+            _, d, i = heappop(q)
+            d = -d
+            if d != dist[i]:
+                continue
+            if i == t:
+                return d, self._trace(parent, t)
+            for j in neighbor_ids(i):
+                if not passable(j):
                     continue
-                if not is_obstacle(next):
-                    q.append(((x + dx, y + dy), steps + 1, history + [(x, y)]))
-                visited.add((x, y))
+                y, x = divmod(j, width)
+                nd = d + (cost(Grid.GridItem(self, x, y)) if cost is not None else 1)
+                if dist[j] is None or nd < dist[j]:
+                    dist[j] = nd
+                    parent[j] = i
+                    h = abs(tx - x) + abs(ty - y) if astar else 0
+                    heappush(q, (nd + h, -nd, j))
+        return None
+
+    def _bidirectional_path(
+        self, s: int, t: int, passable: Callable[[int], bool]
+    ) -> Optional[Tuple[int, List[Coord]]]:
+        if s == t:
+            return 0, []
+        if not passable(t):
+            return None
+        n = len(self)
+        neighbor_ids = self._neighbor_table()
+        parents = (array("i", [-1]) * n, array("i", [-1]) * n)
+        dists = (array("i", [-1]) * n, array("i", [-1]) * n)
+        frontiers = ([s], [t])
+        for side, root in enumerate((s, t)):
+            parents[side][root] = root
+            dists[side][root] = 0
+        while len(frontiers[0]) > 0 and len(frontiers[1]) > 0:
+            # Expand the smaller frontier one whole level at a time, so the
+            # first level where the searches meet contains a shortest path.
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            parent, dist = parents[side], dists[side]
+            other_dist = dists[1 - side]
+            best = None
+            next_frontier = []
+            for i in frontiers[side]:
+                for j in neighbor_ids(i):
+                    # The backwards search may always step onto the start.
+                    if j != s and not passable(j):
+                        continue
+                    if other_dist[j] != -1:
+                        length = dist[i] + 1 + other_dist[j]
+                        if best is None or length < best[0]:
+                            best = (length, i, j)
+                    if parent[j] == -1:
+                        parent[j] = i
+                        dist[j] = dist[i] + 1
+                        next_frontier.append(j)
+            if best is not None:
+                _, i, j = best
+                a, b = (i, j) if side == 0 else (j, i)
+                path = self._trace(parents[0], a)
+                path.append((a % self.__width, a // self.__width))
+                while b != t:
+                    path.append((b % self.__width, b // self.__width))
+                    b = parents[1][b]
+                return len(path), path
+            if side == 0:
+                frontiers = (next_frontier, frontiers[1])
+            else:
+                frontiers = (frontiers[0], next_frontier)
+        return None
 
     def all_paths(
         self,
         start: Tuple[int, int],
         end: Tuple[int, int],
         is_obstacle: Callable[[GridItem[A]], bool] = lambda c: c.data == "#",
-    ) -> List[List[GridItem[A]]]:
-        from collections import deque
+    ) -> List[List[Coord]]:
+        """
+        Finds every orthogonal path between two positions that doesn't visit a
+        position twice, returning the positions visited before reaching the
+        end for each, shortest first.
 
-        q = deque([(start, [])])
+        Walks a single path with backtracking instead of copying the path for
+        every branch.
+        """
+        width = self.__width
+        if self[start] is None or self[end] is None:
+            return []
+        s = start[1] * width + start[0]
+        t = end[1] * width + end[0]
+        passable = self._cell_filter(lambda item: not is_obstacle(item))
+        neighbor_ids = self._neighbor_table()
+        on_path = bytearray(len(self))
+        on_path[s] = 1
+        path = [s]
+        branches = [iter(neighbor_ids(s))]
         paths = []
-        while len(q) > 0:
-            (x, y), history = q.popleft()
-            set_history = set(history)
-            if (x, y) == end:
-                paths.append(history)
-            for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-                if (x + dx, y + dy) in set_history:
-                    continue
-                next = self[x + dx, y + dy]
-                if next is None:
-                    continue
-                if not is_obstacle(next):
-                    q.append(((x + dx, y + dy), history + [(x, y)]))
+        if s == t:
+            paths.append([])
+        while len(branches) > 0:
+            j = next(branches[-1], None)
+            if j is None:
+                branches.pop()
+                on_path[path.pop()] = 0
+                continue
+            if on_path[j] or not passable(j):
+                continue
+            if j == t:
+                paths.append([(i % width, i // width) for i in path])
+                continue
+            on_path[j] = 1
+            path.append(j)
+            branches.append(iter(neighbor_ids(j)))
+        paths.sort(key=len)
         return paths
 
     def __getitem__(self, key: Coord) -> GridItem[A]:
         """
         Index into the grid using a tuple (x, y).
         """
-        if (
-            key[1] < 0
-            or key[1] >= len(self.__data)
-            or key[0] < 0
-            or key[0] >= len(self.__data[0])
-        ):
+        x, y = key
+        if y < 0 or y >= self.__height or x < 0 or x >= self.__width:
             return None
-        return self.__data[key[1]][key[0]]
+        return self._item(y * self.__width + x)
+
+    def _item(self, i: int) -> GridItem[A]:
+        """
+        Get the item for a cell id.
+        """
+        pool = self.__pool
+        item = pool[i] if isinstance(pool, list) else pool.get(i)
+        if item is None:
+            # Reuse items for accessed cells so hot loops over neighbors
+            # don't allocate, but keep the pool of big grids bounded.
+            if isinstance(pool, dict) and len(pool) >= _ITEM_POOL_SIZE:
+                # Items still in use elsewhere go back to being plain views.
+                for old in pool.values():
+                    object.__setattr__(old, "__class__", Grid.GridItem)
+                pool.clear()
+            width = self.__width
+            item = pool[i] = _pooled_item(
+                self, i % width, i // width, i, self.__cells.get(i)
+            )
+        return item
+
+    def _fill_pool(self):
+        """
+        Creates the missing items of a grid that keeps an item for every cell.
+        Items are never dropped from such a grid, so this only has to look
+        for them until the first time it finds none missing.
+        """
+        if self.__pool_full:
+            return
+        pool = self.__pool
+        values = None
+        width = self.__width
+        for i, item in enumerate(pool):
+            if item is None:
+                if values is None:
+                    values = self.__cells.values()
+                pool[i] = _pooled_item(self, i % width, i // width, i, values[i])
+        self.__pool_full = True
+
+    def _items(self, ids: Iterable[int]) -> List[GridItem[A]]:
+        """
+        Get the items for a run of cell ids.
+        """
+        pooled = self._pooled()
+        items = []
+        for i in ids:
+            items.append(pooled(i) or self._item(i))
+        return items
+
+    def __setitem__(self, key: Coord, value: A):
+        """
+        Set the data of a cell using a tuple (x, y).
+        """
+        x, y = key
+        if y < 0 or y >= self.__height or x < 0 or x >= self.__width:
+            raise IndexError(f"{key} is outside of the grid")
+        self._write([(y * self.__width + x, value)])
+
+    def _invalidate(self):
+        """
+        Drops everything cached from the current cell values.
+        """
+        if len(self.__raycasts) > 0:
+            self.__raycasts.clear()
+        if len(self.__fields) > 0:
+            self.__fields.clear()
+
+    def _replace(self, cells: _ObjectCells):
+        """
+        Swaps in entirely new storage of the same size.
+        """
+        self._invalidate()
+        if self.__cells.shares > 0:
+            self.__cells.shares -= 1
+        self.__cells = cells
+        pool = self.__pool
+        for i, item in enumerate(pool) if isinstance(pool, list) else pool.items():
+            if item is not None:
+                _set_item_data(item, cells.get(i))
+
+    def _write(self, changes: List[Tuple[int, A]]):
+        """
+        Writes (cell id, value) pairs into storage.
+        """
+        if len(changes) == 0:
+            return
+        self._invalidate()
+        cells = self.__cells
+        if cells.shares > 0:
+            # Another grid is still using this storage, so take a copy first.
+            cells.shares -= 1
+            cells = cells.copy()
+            if self.__cells.index is not None:
+                cells.index = {v: ids.copy() for v, ids in self.__cells.index.items()}
+        index = cells.index
+        pooled = self._pooled()
+        for i, value in changes:
+            if index is not None:
+                old = cells.get(i)
+                index[old].discard(i)
+                if value in index:
+                    index[value].add(i)
+                else:
+                    index[value] = {i}
+            while True:
+                try:
+                    cells.set(i, value)
+                    break
+                except (TypeError, ValueError, OverflowError):
+                    # The value doesn't fit the current storage, move to
+                    # storage that is more general until it does.
+                    cells = cells.widen()
+                    cells.index = index
+            item = pooled(i)
+            if item is not None:
+                _set_item_data(item, value)
+        self.__cells = cells
+
+    @property
+    def _width(self) -> int:
+        return self.__width
+
+    def _cell(self, i: int) -> A:
+        return self.__cells.get(i)
 
     def __len__(self) -> int:
         """
         Get the total number of items in the grid.
-
-        Assumes that the grid is not jagged.
         """
-        return len(self.__data) * len(self.__data[0]) if len(self.__data) > 0 else 0
+        return self.__width * self.__height
 
     def size(self) -> Tuple[int, int]:
         """
         Get the size of the grid as a tuple (width, height).
-
-        Assumes that the grid is not jagged.
         """
-        return (len(self.__data[0]), len(self.__data))
+        return (self.__width, self.__height)
 
     def to_string(self, item_to_str: Callable[[GridItem[A]], str] = str) -> str:
         return "\n".join(
-            ["".join([item_to_str(item) for item in row]) for row in self.__data]
+            [
+                "".join(item_to_str(self[x, y]) for x in range(self.__width))
+                for y in range(self.__height)
+            ]
         )
 
 
+class _PooledItem(Grid.GridItem[A]):
+    """
+    A grid item handed out from a grid's item pool. The grid writes the
+    item's data into a slot whenever the cell changes, so reading it is a
+    plain attribute lookup rather than a trip through the storage. Items
+    dropped from the pool turn back into plain `Grid.GridItem` views.
+    """
+
+    __slots__ = ()
+
+    data = Grid.GridItem._data
+
+    def __setattr__(self, name: str, value):
+        if name == "data":
+            self.parent[self.x, self.y] = value
+        else:
+            object.__setattr__(self, name, value)
+
+
+_set_item_data = Grid.GridItem._data.__set__
+
+
+def _pooled_item(parent: Grid[A], x: int, y: int, i: int, data: A) -> _PooledItem[A]:
+    # Fill in a plain item and then switch its class, which skips both
+    # GridItem.__init__ and the __setattr__ override.
+    item = Grid.GridItem.__new__(Grid.GridItem)
+    item.parent = parent
+    item.x = x
+    item.y = y
+    item.id = i
+    item._data = data
+    item.__class__ = _PooledItem
+    return item
+
+
 def compare_x(a: Grid.GridItem[A], b: Grid.GridItem[B]) -> int:
     return a.x - b.x
 
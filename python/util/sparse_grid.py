@@ -0,0 +1,388 @@
+from collections import deque
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from .grid import Coord, Grid, _default_item_parser, _default_line_splitter
+
+A = TypeVar("A")
+B = TypeVar("B")
+
+# Cells are stored in square chunks of this many cells per side.
+_CHUNK_BITS = 6
+_CHUNK_SIZE = 1 << _CHUNK_BITS
+_CHUNK_MASK = _CHUNK_SIZE - 1
+
+# Marks cells in a chunk that haven't been set.
+_UNSET = object()
+
+
+class SparseGrid(Generic[A]):
+    """
+    An unbounded grid that only stores cells that differ from a default
+    value.
+
+    Cells live in 64x64 chunks keyed by chunk coordinate, so coordinates can be
+    negative and memory scales with the number of occupied cells rather than
+    the bounding box. Reading a cell that was never set gives the default.
+
+    Items support the same neighbor, raycast and filter helpers as grid items.
+    """
+
+    class GridItem(Grid.GridItem[A]):
+        __slots__ = ()
+
+        def __init__(self, parent: "SparseGrid[A]", x: int, y: int):
+            self.parent = parent
+            self.x = x
+            self.y = y
+            self.id = (x, y)
+
+        @property
+        def data(self) -> A:
+            return self.parent.get(self.x, self.y)
+
+        @data.setter
+        def data(self, value: A):
+            self.parent[self.x, self.y] = value
+
+        def __hash__(self):
+            return hash(self.id)
+
+        def clone(self, parent=None, x=None, y=None):
+            return SparseGrid.GridItem(
+                parent if parent is not None else self.parent,
+                x if x is not None else self.x,
+                y if y is not None else self.y,
+            )
+
+        def neighbor_positions(
+            self,
+            horizontal: bool = True,
+            vertical: bool = True,
+            diagonal: bool = False,
+            bounds: bool = True,
+        ) -> List[Tuple[int, int]]:
+            """
+            Get a list of neighbor coordinates. The grid has no edges, so
+            bounds is ignored.
+            """
+            x, y = self.x, self.y
+            res = []
+            if vertical:
+                res.append((x, y - 1))
+            if horizontal:
+                res += [(x - 1, y), (x + 1, y)]
+            if vertical:
+                res.append((x, y + 1))
+            if diagonal:
+                res += [(x + 1, y + 1), (x - 1, y + 1), (x + 1, y - 1), (x - 1, y - 1)]
+            return res
+
+        def neighbors(
+            self,
+            horizontal: bool = True,
+            vertical: bool = True,
+            diagonal: bool = False,
+            bounds: bool = True,
+        ) -> List["SparseGrid.GridItem[A]"]:
+            """
+            Get a list of neighboring items. The grid has no edges, so bounds
+            is ignored.
+            """
+            return [
+                self.parent[position]
+                for position in self.neighbor_positions(horizontal, vertical, diagonal)
+            ]
+
+        def raycast(
+            self,
+            direction: Tuple[int, int],
+            hit: Callable[["SparseGrid.GridItem[A]"], bool],
+        ) -> Optional["SparseGrid.GridItem[A]"]:
+            """
+            Finds the first item in a direction that the hit filter accepts.
+            Everything outside the bounding box of set cells is the default, so
+            the filter is only tried on the first cell outside the box, and
+            the ray stops once it leaves the box without a hit.
+            """
+            dx, dy = direction
+            x, y = self.x + dx, self.y + dy
+            bounds = self.parent.bounds()
+            if bounds is None:
+                item = self.parent[x, y]
+                return item if hit(item) else None
+            min_x, min_y, max_x, max_y = bounds
+            if not (min_x <= x <= max_x and min_y <= y <= max_y):
+                item = self.parent[x, y]
+                if hit(item):
+                    return item
+            # Skip straight to the box if the ray starts outside of it.
+            while not (min_x <= x <= max_x and min_y <= y <= max_y):
+                if (dx <= 0 and x < min_x) or (dx >= 0 and x > max_x):
+                    return None
+                if (dy <= 0 and y < min_y) or (dy >= 0 and y > max_y):
+                    return None
+                x, y = x + dx, y + dy
+            while min_x <= x <= max_x and min_y <= y <= max_y:
+                item = self.parent[x, y]
+                if hit(item):
+                    return item
+                x, y = x + dx, y + dy
+            item = self.parent[x, y]
+            return item if hit(item) else None
+
+        def raycast_data(
+            self, direction: Tuple[int, int], match: Union[A, Callable[[A], bool]]
+        ) -> Optional["SparseGrid.GridItem[A]"]:
+            """
+            Finds the first item in a direction whose data matches a value or
+            data predicate.
+            """
+            test = match if callable(match) else lambda v: v == match
+            return self.raycast(direction, lambda item: test(item.data))
+
+    def __init__(self, default: Optional[A] = None):
+        self.__default = default
+        self.__chunks: Dict[Coord, list] = {}
+        self.__chunk_counts: Dict[Coord, int] = {}
+        self.__count = 0
+        self.__bounds: Optional[Tuple[int, int, int, int]] = None
+
+    @staticmethod
+    def parse(
+        raw: List[Iterable[A]],
+        item_parser: Callable[[A, int, int], B] = _default_item_parser,
+        default: Optional[B] = None,
+    ) -> "SparseGrid[B]":
+        """
+        Parses a list of lists into a sparse grid using the given item parser.
+        Cells equal to the default aren't stored.
+        """
+        grid = SparseGrid(default)
+        for y, row in enumerate(raw):
+            for x, item in enumerate(row):
+                value = item_parser(item, x, y)
+                if value != default:
+                    grid[x, y] = value
+        return grid
+
+    @staticmethod
+    def read(
+        filename: str,
+        item_parser: Callable[[A, int, int], B] = _default_item_parser,
+        line_splitter: Callable[[List[str]], List[A]] = _default_line_splitter,
+        default: Optional[B] = None,
+    ) -> "SparseGrid[B]":
+        """
+        Parses a text file into a sparse grid using the given item parser.
+        Defaults to splitting lines character-wise. Cells equal to the default
+        aren't stored.
+
+        Example:
+        ```
+        SparseGrid.read("res/day01.txt", default=".")
+        ```
+        """
+        with open(filename) as f:
+            inp = list(map(str.strip, f.readlines()))
+        return SparseGrid.parse(map(line_splitter, inp), item_parser, default)
+
+    @staticmethod
+    def from_grid(grid: Grid[A], default: Optional[A] = None) -> "SparseGrid[A]":
+        """
+        Copies the cells of a grid that differ from the default.
+        """
+        sparse = SparseGrid(default)
+        for item in grid.items():
+            if item.data != default:
+                sparse[item.x, item.y] = item.data
+        return sparse
+
+    def default(self) -> Optional[A]:
+        return self.__default
+
+    def get(self, x: int, y: int) -> A:
+        """
+        Get the data at a position.
+        """
+        chunk = self.__chunks.get((x >> _CHUNK_BITS, y >> _CHUNK_BITS))
+        if chunk is None:
+            return self.__default
+        value = chunk[((y & _CHUNK_MASK) << _CHUNK_BITS) | (x & _CHUNK_MASK)]
+        return self.__default if value is _UNSET else value
+
+    def __getitem__(self, key: Coord) -> "SparseGrid.GridItem[A]":
+        """
+        Index into the grid using a tuple (x, y). Every position has an item.
+        """
+        return SparseGrid.GridItem(self, key[0], key[1])
+
+    def __setitem__(self, key: Coord, value: A):
+        """
+        Set the data at a position. Setting the default clears the cell.
+        """
+        x, y = key
+        chunk_key = (x >> _CHUNK_BITS, y >> _CHUNK_BITS)
+        offset = ((y & _CHUNK_MASK) << _CHUNK_BITS) | (x & _CHUNK_MASK)
+        chunk = self.__chunks.get(chunk_key)
+        if value == self.__default:
+            if chunk is None or chunk[offset] is _UNSET:
+                return
+            chunk[offset] = _UNSET
+            self.__count -= 1
+            self.__chunk_counts[chunk_key] -= 1
+            if self.__chunk_counts[chunk_key] == 0:
+                del self.__chunks[chunk_key]
+                del self.__chunk_counts[chunk_key]
+            # The cell may have been on the edge of the bounding box.
+            self.__bounds = None
+            return
+        if chunk is None:
+            chunk = self.__chunks[chunk_key] = [_UNSET] * (_CHUNK_SIZE * _CHUNK_SIZE)
+            self.__chunk_counts[chunk_key] = 0
+        if chunk[offset] is _UNSET:
+            self.__count += 1
+            self.__chunk_counts[chunk_key] += 1
+            if self.__bounds is not None:
+                min_x, min_y, max_x, max_y = self.__bounds
+                self.__bounds = (
+                    min(min_x, x),
+                    min(min_y, y),
+                    max(max_x, x),
+                    max(max_y, y),
+                )
+            elif self.__count == 1:
+                self.__bounds = (x, y, x, y)
+        chunk[offset] = value
+
+    def __len__(self) -> int:
+        """
+        Get the number of set cells.
+        """
+        return self.__count
+
+    def positions(self) -> Iterable[Coord]:
+        """
+        Iterates over the positions of set cells, in no particular order.
+        """
+        for (cx, cy), chunk in self.__chunks.items():
+            base_x, base_y = cx << _CHUNK_BITS, cy << _CHUNK_BITS
+            for offset, value in enumerate(chunk):
+                if value is not _UNSET:
+                    yield (
+                        base_x + (offset & _CHUNK_MASK),
+                        base_y + (offset >> _CHUNK_BITS),
+                    )
+
+    def items(self) -> Iterable["SparseGrid.GridItem[A]"]:
+        """
+        Iterates over the set cells, in no particular order.
+        """
+        for x, y in self.positions():
+            yield SparseGrid.GridItem(self, x, y)
+
+    def bounds(self) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Get the bounding box of the set cells as (min x, min y, max x, max y),
+        or None if no cells are set.
+        """
+        if self.__bounds is None and self.__count > 0:
+            xs, ys = zip(*self.positions())
+            self.__bounds = (min(xs), min(ys), max(xs), max(ys))
+        return self.__bounds
+
+    def size(self) -> Tuple[int, int]:
+        """
+        Get the size of the bounding box of the set cells as (width, height).
+        """
+        bounds = self.bounds()
+        if bounds is None:
+            return (0, 0)
+        min_x, min_y, max_x, max_y = bounds
+        return (max_x - min_x + 1, max_y - min_y + 1)
+
+    def filter(
+        self, filter: Callable[["SparseGrid.GridItem[A]"], bool]
+    ) -> List["SparseGrid.GridItem[A]"]:
+        """
+        Finds the set cells where a given filter returns true, in row-major
+        order.
+        """
+        return sorted(item for item in self.items() if filter(item))
+
+    def flood(
+        self,
+        start: Union[Coord, "SparseGrid.GridItem[A]"],
+        is_valid: Callable[["SparseGrid.GridItem[A]"], bool],
+        get_next: Optional[
+            Callable[["SparseGrid.GridItem[A]"], List["SparseGrid.GridItem[A]"]]
+        ] = None,
+    ) -> Tuple[int, Set["SparseGrid.GridItem[A]"]]:
+        """
+        Floods the grid starting at the given coordinates, returning the number
+        of valid items and a set of valid items. The grid has no edges, so
+        is_valid has to stop the flood.
+        """
+        start = start if isinstance(start, tuple) else (start.x, start.y)
+        to_visit = deque([start])
+        visited = {start}
+        valid = set()
+        while len(to_visit) > 0:
+            item = self[to_visit.popleft()]
+            if not is_valid(item):
+                continue
+            valid.add(item)
+            neighbors = get_next(item) if get_next is not None else item.neighbors()
+            for neighbor in neighbors:
+                position = (neighbor.x, neighbor.y)
+                if position not in visited:
+                    visited.add(position)
+                    to_visit.append(position)
+        return len(valid), valid
+
+    def clone(self) -> "SparseGrid[A]":
+        grid = SparseGrid(self.__default)
+        grid.__chunks = {key: chunk.copy() for key, chunk in self.__chunks.items()}
+        grid.__chunk_counts = self.__chunk_counts.copy()
+        grid.__count = self.__count
+        grid.__bounds = self.__bounds
+        return grid
+
+    def to_grid(self) -> Grid[A]:
+        """
+        Copies the bounding box of the set cells into a dense grid.
+        """
+        bounds = self.bounds()
+        if bounds is None:
+            return Grid([])
+        min_x, min_y, max_x, max_y = bounds
+        return Grid(
+            [
+                [self.get(x, y) for x in range(min_x, max_x + 1)]
+                for y in range(min_y, max_y + 1)
+            ]
+        )
+
+    def to_string(
+        self, item_to_str: Callable[["SparseGrid.GridItem[A]"], str] = str
+    ) -> str:
+        bounds = self.bounds()
+        if bounds is None:
+            return ""
+        min_x, min_y, max_x, max_y = bounds
+        return "\n".join(
+            [
+                "".join(item_to_str(self[x, y]) for x in range(min_x, max_x + 1))
+                for y in range(min_y, max_y + 1)
+            ]
+        )